@@ -15,7 +15,9 @@ def int_to_roman(num: int) -> str:
 def main() -> None:
     with open("input.txt", "w") as f:
         for n in range(1, 4000):
-            print(f"{int_to_roman(n)} => {'|' * n}", file=f)
+            # Long runs are written in the compact X{N} form that utils.Program understands.
+            unary = f"|{{{n}}}" if n > 4 else "|" * n
+            print(f"{int_to_roman(n)} => {unary}", file=f)
 
 
 if __name__ == "__main__":
@@ -51,9 +51,9 @@ def run(
             py_file = Path(quest_dir, py_file).resolve()
     print(f"Running quest {quest} with python file {py_file.name}")
 
-    input_file = py_file.parent / "input.txt"
+    input_files = (py_file.parent / name for name in ("input.txt", "input.txt.gz", "input.txt.zst"))
     args = list(ctx.args)
-    if input_file.exists():
+    if input_file := next((f for f in input_files if f.exists()), None):
         args.extend(["-i", str(input_file)])
 
     env = os.environ.copy()
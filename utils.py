@@ -1,36 +1,85 @@
 import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import marshal
+import math
+import mmap
 import re
+import shutil
 import sys
 import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
 import unicodedata
-from concurrent.futures import ProcessPoolExecutor
-from contextlib import suppress
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, wait
+from contextlib import closing, contextmanager, nullcontext, redirect_stdout, suppress
 from functools import lru_cache, partial
+from itertools import groupby, islice, repeat
 from pathlib import Path
-from string import ascii_lowercase
-from typing import Counter, Literal, NamedTuple, Self
+from string import ascii_lowercase, whitespace
+from typing import (
+    Callable,
+    Counter,
+    Hashable,
+    Iterable,
+    Iterator,
+    Literal,
+    NamedTuple,
+    NoReturn,
+    Protocol,
+    Self,
+    Sequence,
+    TextIO,
+    runtime_checkable,
+)
 
-import logic_mill_rs as mill
 import pretty_errors as _
 import pyperclip
 from tqdm import tqdm
 
+try:
+    import logic_mill_rs as mill
+except ImportError:  # The native wheel couldn't be built; fall back to the pure-Python backend.
+    mill = None
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for the batched backend.
+    np = None
+
+try:
+    import zstandard
+except ImportError:  # Only needed for zstd-compressed inputs.
+    zstandard = None
+
 LETTERS = set(ascii_lowercase) | set("äöõü") | set("-")
 GREEN = "\x1b[32m"
 RED = "\x1b[5;31m"
 YELLOW = "\x1b[5;33m"
 
-def get_caller_info():
-    n = 1
-    while True:
-        frame = sys._getframe(n)
-        filename = os.path.abspath(frame.f_code.co_filename)
-        if filename == os.path.abspath(__file__):
-            n += 1
-            continue
-        lineno = frame.f_lineno
-        return os.path.basename(filename), lineno
+_UTILS_PATH = os.path.abspath(__file__)
+
 
+@lru_cache(maxsize=None)
+def _source_name(filename: str) -> str | None:
+    """The basename of a source file, or None for this module, whose frames are skipped."""
+    filename = os.path.abspath(filename)
+    return None if filename == _UTILS_PATH else os.path.basename(filename)
+
+
+def get_caller_info():
+    frame = sys._getframe(1)
+    while (name := _source_name(frame.f_code.co_filename)) is None:
+        frame = frame.f_back
+    return name, frame.f_lineno
 
 
 class _Same:
@@ -45,9 +94,59 @@ def is_unary(tape: str) -> bool:
     return set(tape) == {"|"}
 
 
+# A symbol repeated N times can be written as `X{N}` in input files, e.g. `|{3999} => |{63}`.
+_REPEAT = re.compile(r"(.)\{(\d+)\}")
+_RUN = re.compile(r"(.)\1*", re.DOTALL)
+
+
+def tape_runs(tape: str) -> list[tuple[str, int]]:
+    """Split a tape, which may be in compact form, into (symbol, count) runs of equal symbols."""
+    runs: list[list] = []
+
+    def add(symbol: str, count: int) -> None:
+        if runs and runs[-1][0] == symbol:
+            runs[-1][1] += count
+        elif count:
+            runs.append([symbol, count])
+
+    position = 0
+    for match in _REPEAT.finditer(tape):
+        for run in _RUN.finditer(tape, position, match.start()):
+            add(run[1], run.end() - run.start())
+        add(match[1], int(match[2]))
+        position = match.end()
+    for run in _RUN.finditer(tape, position):
+        add(run[1], run.end() - run.start())
+    return [(symbol, count) for symbol, count in runs]
+
+
+def expand_tape(tape: str) -> str:
+    """Spell out a tape given in compact form."""
+    return _REPEAT.sub(lambda match: match[1] * int(match[2]), tape) if "{" in tape else tape
+
+
+def compact_tape(tape: str | Iterable[tuple[str, int]]) -> str:
+    """Write a tape, or its runs, in compact form."""
+    runs = tape_runs(tape) if isinstance(tape, str) else tape
+    return "".join(f"{symbol}{{{count}}}" if count > 4 else symbol * count for symbol, count in runs)
+
+
+def same_tape(a: str, b: str) -> bool:
+    """Compare two tapes, either of which may be in compact form, without spelling them out."""
+    return tape_runs(a) == tape_runs(b) if "{" in a or "{" in b else a == b
+
+
+def tape_length(tape: str) -> int:
+    """Length of a tape, which may be in compact form."""
+    return sum(count for _, count in tape_runs(tape)) if "{" in tape else len(tape)
+
+
 def count_unary(tape: str) -> int | None:
-    """Count the number of '|' characters in a unary tape."""
-    return tape.count("|") if is_unary(tape) else None
+    """Count the number of '|' characters in a unary tape, which may be in compact form."""
+    if "{" not in tape:
+        return tape.count("|") if is_unary(tape) else None
+    runs = tape_runs(tape)
+    return runs[0][1] if len(runs) == 1 and runs[0][0] == "|" else None
 
 
 def base_and_suffix(n: str) -> tuple[str, int]:
@@ -101,25 +200,2021 @@ def build_safe_charset(use_full_plane: bool = False) -> str:
     return "".join(chars)
 
 
-def _do_run(item: tuple[str, str | None], rules: str, quiet: bool):
-    line, expected_output = item
-    logic_mill = mill.LogicMill(rules)
-    result, steps = logic_mill.run(line.strip(), verbose=not quiet)
-    return line, expected_output, logic_mill, result, steps
+BLANK = "_"
+
+
+class Backend(Protocol):
+    """What the runner needs from a Logic Mill implementation, built from the rules text."""
+
+    def run(self, tape: str, verbose: bool = False) -> tuple[str, int]:
+        """Run the machine on the given tape, returning the final tape and the steps taken."""
+        ...
+
+    def state_count(self) -> int:
+        """Number of distinct states mentioned by the rules."""
+        ...
+
+    def unused_rules(self) -> list[tuple[str, str]]:
+        """The (state, symbol) pairs of the rules that didn't fire during the last run."""
+        ...
+
+
+def parse_rules(rules: str) -> list[Transition]:
+    """Parse a rules text (as written to rules.txt) into its transitions, in order."""
+    transitions = []
+    for lineno, line in enumerate(rules.splitlines(), 1):
+        line = line.split("//", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split()
+        if len(parts) != 5 or parts[4] not in ("L", "R"):
+            raise ValueError(f"Invalid rule on line {lineno}: {line!r}")
+        transitions.append(Transition(*parts))
+    return transitions
+
+
+class MachineError(RuntimeError):
+    """Raised when a run doesn't halt properly: a rule is missing, it loops or it's over budget."""
+
+
+def _check_steps(steps: int, max_steps: int | None) -> None:
+    if max_steps is not None and steps > max_steps:
+        raise MachineError(f"Ran out of the budget of {max_steps:_} steps")
+
+
+def _configuration(state: Hashable, cells: Sequence[int], head: int) -> Hashable:
+    """A snapshot of the machine's configuration that doesn't depend on the blank padding of the
+    tape, so that it can be compared with the snapshots taken before the tape grew."""
+    try:
+        data = bytes(cells)
+    except ValueError:  # More than 256 symbols: compare the padded tapes as they are.
+        return state, head, tuple(cells)
+    body = data.lstrip(b"\0")
+    return state, head - (len(data) - len(body)), body.rstrip(b"\0")
+
+
+class _Watchdog:
+    """Enforces the step and wall-clock budgets of a run, and catches runs that loop forever.
+
+    The engines call `check` with their current configuration whenever the step count reaches the
+    checkpoint it returned last time: every _INTERVAL steps, or every `size` steps once the tape is
+    longer than that, so that taking the snapshots stays cheap next to the run itself. With a
+    timeout, the gap is also kept to what a sixteenth of it takes at the pace so far, so that the
+    deadline isn't overshot by much when the tape grows as fast as the step count. Each one is
+    compared with one saved after an exponentially growing number of checks (Brent's algorithm), so
+    a machine that keeps going through the same configurations is stopped within a few periods."""
+
+    _INTERVAL = 1 << 12
+
+    def __init__(self, max_steps: int | None = None, timeout: float | None = None) -> None:
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self._saved: Hashable = None
+        self._saved_steps = 0
+        self._checks = 0
+        self._power = 1
+
+    def next_check(self, steps: int, size: int = 0) -> int:
+        gap = max(self._INTERVAL, size)
+        if self.deadline is not None and steps and gap > self._INTERVAL:
+            elapsed = time.monotonic() - self.deadline + self.timeout
+            gap = min(gap, max(self._INTERVAL, int(steps * self.timeout / (16 * elapsed or 1))))
+        checkpoint = steps + gap
+        return checkpoint if self.max_steps is None else min(checkpoint, self.max_steps + 1)
+
+    def check(self, steps: int, configuration: Hashable, size: int) -> int:
+        _check_steps(steps, self.max_steps)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise MachineError(f"Timed out after {self.timeout}s and {steps:_} steps")
+        if configuration == self._saved:
+            raise MachineError(
+                f"Loops forever: the configuration at step {steps:_}"
+                f" is the same as at step {self._saved_steps:_}"
+            )
+        self._checks += 1
+        if self._checks == self._power:
+            self._saved, self._saved_steps = configuration, steps
+            self._checks = 0
+            self._power *= 2
+        return self.next_check(steps, size)
+
+
+class PyLogicMill:
+    """Pure-Python reference implementation of the Logic Mill.
+
+    States and symbols are interned to integers, and the transitions live in a flat table indexed by
+    `state * symbol_count + symbol`, so that each step is a single list lookup."""
+
+    def __init__(self, rules: str) -> None:
+        self._transitions = parse_rules(rules)
+        states = dict.fromkeys(["INIT", "HALT"])
+        symbols = dict.fromkeys([BLANK])
+        for t in self._transitions:
+            states.update(dict.fromkeys((t.from_state, t.to_state)))
+            symbols.update(dict.fromkeys((t.symbol, t.new_symbol)))
+        self._states = list(states)
+        self._symbols = list(symbols)
+        self._used = bytearray(len(self._transitions))
+        self._build()
+
+    def _build(self) -> None:
+        self._state_ids = state_ids = {state: i for i, state in enumerate(self._states)}
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(self._symbols)}
+        stride = len(self._symbols)
+        # Each entry is (next state * stride, new symbol, head delta, rule index), where the next
+        # state of a transition to HALT is encoded as -1.
+        self._table: list[tuple[int, int, int, int] | None] = [None] * (len(self._states) * stride)
+        for i, t in enumerate(self._transitions):
+            index = state_ids[t.from_state] * stride + self._symbol_ids[t.symbol]
+            if self._table[index] is not None:
+                raise ValueError(f"Duplicate rule for state {t.from_state} and symbol {t.symbol}")
+            next_base = -1 if t.to_state == "HALT" else state_ids[t.to_state] * stride
+            delta = 1 if t.direction == "R" else -1
+            self._table[index] = (next_base, self._symbol_ids[t.new_symbol], delta, i)
+
+    def _load(self, tape: str) -> list[int]:
+        if any(symbol not in self._symbol_ids for symbol in set(tape)):
+            self._symbols.extend(sorted(set(tape) - set(self._symbols)))
+            self._build()
+        return [self._symbol_ids[symbol] for symbol in tape or BLANK]
+
+    def _fail(self, base: int, symbol: int) -> NoReturn:
+        state = self._states[base // len(self._symbols)]
+        raise MachineError(f"No rule for state {state} and symbol {self._symbols[symbol]}")
+
+    def _trace(self, steps: int, base: int, tape: list[int], head: int) -> None:
+        cells = "".join(self._symbols[symbol] for symbol in tape)
+        print(f"{steps:>8} {self._states[base // len(self._symbols)]:>16} {cells}")
+        print(f"{'':>8} {'':>16} {' ' * head}^")
+
+    def _result(self, tape: list[int]) -> str:
+        return "".join(self._symbols[symbol] for symbol in tape).strip(BLANK)
+
+    def run(
+        self,
+        tape: str,
+        verbose: bool = False,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[str, int]:
+        """Run the machine on the given tape, raising MachineError if it takes more than
+        `max_steps` steps or `timeout` seconds, or if it's caught looping forever."""
+        self._used = bytearray(len(self._transitions))
+        watchdog = _Watchdog(max_steps, timeout)
+        cells, steps = self._simulate(self._load(tape), 0, 0, 0, verbose, watchdog)
+        return self._result(cells), steps
+
+    def _simulate(
+        self,
+        cells: list[int],
+        head: int,
+        base: int,
+        steps: int,
+        verbose: bool = False,
+        watchdog: _Watchdog | None = None,
+    ) -> tuple[list[int], int]:
+        """Run the machine from the given configuration until it halts, marking the rules that
+        fire in self._used. Returns the final tape and the total step count."""
+        table, used = self._table, self._used
+        watchdog = watchdog or _Watchdog()
+        checkpoint = watchdog.next_check(steps)
+        while True:
+            if verbose:
+                self._trace(steps, base, cells, head)
+            if steps >= checkpoint:
+                checkpoint = watchdog.check(steps, _configuration(base, cells, head), len(cells))
+            symbol = cells[head]
+            entry = table[base + symbol]
+            if entry is None:
+                self._fail(base, symbol)
+            base, cells[head], delta, rule = entry
+            used[rule] = 1
+            head += delta
+            steps += 1
+            if base < 0:
+                break
+            if head < 0:
+                grow = len(cells)
+                cells[:0] = [0] * grow
+                head += grow
+            elif head == len(cells):
+                cells.extend([0] * len(cells))
+        return cells, steps
+
+    def state_count(self) -> int:
+        return len({t.from_state for t in self._transitions} | {t.to_state for t in self._transitions})
+
+    def unused_rules(self) -> list[tuple[str, str]]:
+        return [
+            (t.from_state, t.symbol) for t, used in zip(self._transitions, self._used) if not used
+        ]
+
+
+class SweepLogicMill(PyLogicMill):
+    """Pure-Python Logic Mill that skips over self-loop sweeps in a single operation.
+
+    A self-loop is a rule that keeps the state and the symbol and moves on, i.e. what Program.ignore
+    and Program.find emit. While the machine is in such a state it just walks over every cell whose
+    symbol loops in the same direction, so the whole run is found by stripping those symbols off
+    the tape with bytes.lstrip/rstrip, and its length added to the step counter at once."""
+
+    def _build(self) -> None:
+        super()._build()
+        stride = len(self._symbols)
+        loops: dict[tuple[int, int], list[int]] = {}
+        for t in self._transitions:
+            if t.to_state == t.from_state and t.new_symbol == t.symbol:
+                delta = 1 if t.direction == "R" else -1
+                base = self._state_ids[t.from_state] * stride
+                loops.setdefault((base, delta), []).append(self._symbol_ids[t.symbol])
+
+        # For each self-loop entry of the table: (direction, symbols, rule index by symbol).
+        self._sweeps: list[tuple[int, bytes, dict[int, int]] | None] = [None] * len(self._table)
+        for (base, delta), symbols in loops.items():
+            sweep = (delta, bytes(symbols), {s: self._table[base + s][3] for s in symbols})
+            for symbol in symbols:
+                self._sweeps[base + symbol] = sweep
+
+    @staticmethod
+    def _run_length(cells: bytearray, head: int, delta: int, symbols: bytes) -> int:
+        """Length of the run of cells holding one of the given symbols, going from the head in the
+        given direction. The tape is stripped in exponentially growing windows, so that the cost is
+        proportional to the length of the run rather than to the size of the tape."""
+        length, window = 0, 16
+        while True:
+            if delta > 0:
+                start = head + length
+                end = min(len(cells), start + window)
+                kept = len(cells[start:end].lstrip(symbols))
+                at_edge = end == len(cells)
+            else:
+                end = head + 1 - length
+                start = max(0, end - window)
+                kept = len(cells[start:end].rstrip(symbols))
+                at_edge = start == 0
+            length += end - start - kept
+            if kept or at_edge:
+                return length
+            window *= 2
+
+    def run(
+        self,
+        tape: str,
+        verbose: bool = False,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[str, int]:
+        if verbose or len(self._symbols) > 256:
+            return super().run(tape, verbose, max_steps, timeout)
+
+        cells = bytearray(self._load(tape))
+        table, sweeps = self._table, self._sweeps
+        used = self._used = bytearray(len(self._transitions))
+        watchdog = _Watchdog(max_steps, timeout)
+        base = head = steps = 0
+        checkpoint = watchdog.next_check(steps)
+        while True:
+            if steps >= checkpoint:
+                checkpoint = watchdog.check(steps, _configuration(base, cells, head), len(cells))
+            index = base + cells[head]
+            if (sweep := sweeps[index]) is not None:
+                delta, symbols, rules = sweep
+                length = self._run_length(cells, head, delta, symbols)
+                run_start = head if delta > 0 else head + 1 - length
+                for symbol in set(cells[run_start : run_start + length]) if len(rules) > 1 else rules:
+                    used[rules[symbol]] = 1
+                steps += length
+                head += delta * length
+                if 0 <= head < len(cells):
+                    continue
+                if 0 in rules:
+                    # The run reaches the end of the tape and the loop keeps going over blanks.
+                    self._fail_forever(base)
+                if head < 0:
+                    grow = len(cells)
+                    cells[:0] = bytes(grow)
+                    head += grow
+                else:
+                    cells.extend(bytes(len(cells)))
+                continue
+
+            entry = table[index]
+            if entry is None:
+                self._fail(base, cells[head])
+            base, cells[head], delta, rule = entry
+            used[rule] = 1
+            head += delta
+            steps += 1
+            if base < 0:
+                break
+            if head < 0:
+                grow = len(cells)
+                cells[:0] = bytes(grow)
+                head += grow
+            elif head == len(cells):
+                cells.extend(bytes(len(cells)))
+        return self._result(cells), steps
+
+    def _fail_forever(self, base: int) -> NoReturn:
+        state = self._states[base // len(self._symbols)]
+        raise MachineError(f"State {state} sweeps over blank cells forever")
+
+
+class RunLengthLogicMill(SweepLogicMill):
+    """Pure-Python Logic Mill whose tape is stored as runs of equal symbols.
+
+    The tape is split into two stacks of [symbol, length] runs, one on each side of the head (with
+    the run nearest to the head on top), so that a step only ever touches the top of each stack and
+    memory scales with the number of runs rather than the length of the tape. Self-loop sweeps move
+    whole runs from one stack to the other at once, like in SweepLogicMill."""
+
+    def _load_runs(self, runs: Iterable[tuple[str, int]]) -> list[list[int]]:
+        cells: list[list[int]] = []
+        for symbol, count in runs:
+            if count <= 0:
+                continue
+            if symbol not in self._symbol_ids:
+                self._load(symbol)
+            if cells and cells[-1][0] == self._symbol_ids[symbol]:
+                cells[-1][1] += count
+            else:
+                cells.append([self._symbol_ids[symbol], count])
+        return cells
+
+    def run(
+        self,
+        tape: str,
+        verbose: bool = False,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[str, int]:
+        if verbose:
+            return PyLogicMill.run(self, tape, verbose, max_steps, timeout)
+        runs, steps = self.run_runs(
+            ((symbol, len(list(group))) for symbol, group in groupby(tape)), max_steps, timeout
+        )
+        return "".join(symbol * count for symbol, count in runs), steps
+
+    def run_runs(
+        self,
+        runs: Iterable[tuple[str, int]],
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[list[tuple[str, int]], int]:
+        """Like run, but the input and output tapes are given as (symbol, run length) pairs."""
+        right = self._load_runs(runs)[::-1]
+        left: list[list[int]] = []
+        table, sweeps = self._table, self._sweeps
+        used = self._used = bytearray(len(self._transitions))
+        watchdog = _Watchdog(max_steps, timeout)
+
+        def snapshot(stack: list[list[int]]) -> tuple[tuple[int, ...], ...]:
+            # The blank run at the bottom of a stack stands for the rest of the infinite tape.
+            return tuple(map(tuple, stack[1:] if stack and not stack[0][0] else stack))
+
+        def pop(stack: list[list[int]]) -> int:
+            if not stack:
+                return 0
+            top = stack[-1]
+            top[1] -= 1
+            if not top[1]:
+                stack.pop()
+            return top[0]
+
+        def push(stack: list[list[int]], symbol: int, count: int) -> None:
+            if stack and stack[-1][0] == symbol:
+                stack[-1][1] += count
+            else:
+                stack.append([symbol, count])
+
+        symbol = pop(right)
+        base = steps = 0
+        checkpoint = watchdog.next_check(steps)
+        while True:
+            if steps >= checkpoint:
+                configuration = base, symbol, snapshot(left), snapshot(right)
+                checkpoint = watchdog.check(steps, configuration, len(left) + len(right))
+            index = base + symbol
+            if (sweep := sweeps[index]) is not None:
+                delta, _, rules = sweep
+                ahead, behind = (right, left) if delta > 0 else (left, right)
+                used[rules[symbol]] = 1
+                push(behind, symbol, 1)
+                steps += 1
+                while ahead and ahead[-1][0] in rules:
+                    symbol, count = ahead.pop()
+                    used[rules[symbol]] = 1
+                    push(behind, symbol, count)
+                    steps += count
+                if not ahead and 0 in rules:
+                    self._fail_forever(base)
+                symbol = pop(ahead)
+                continue
+
+            entry = table[index]
+            if entry is None:
+                self._fail(base, symbol)
+            base, new_symbol, delta, rule = entry
+            used[rule] = 1
+            steps += 1
+            if delta > 0:
+                push(left, new_symbol, 1)
+                symbol = pop(right)
+            else:
+                push(right, new_symbol, 1)
+                symbol = pop(left)
+            if base < 0:
+                break
+
+        push(left, symbol, 1)
+        for symbol, count in reversed(right):
+            push(left, symbol, count)
+        start, end = 0, len(left)
+        while start < end and left[start][0] == 0:
+            start += 1
+        while end > start and left[end - 1][0] == 0:
+            end -= 1
+        return [(self._symbols[symbol], count) for symbol, count in left[start:end]], steps
+
+
+class CompiledLogicMill(PyLogicMill):
+    """Logic Mill that compiles the rules into specialized Python code.
+
+    Every state becomes its own function, dispatching on the symbol under the head with straight-line
+    code for each transition and returning the function of the next state, so that the hot states
+    show up by name in cProfile & co. Self-loops become local `while` loops. The generated source is
+    compiled once and cached on disk next to this file, keyed by the hash of the rules."""
+
+    _CACHE_DIR = Path(__file__).with_name("__pycache__") / "compiled_mills"
+    _VERSION = 2
+
+    def __init__(self, rules: str) -> None:
+        super().__init__(rules)
+        key = hashlib.sha256(f"{self._VERSION}\n{rules}".encode("utf-8")).hexdigest()
+        source_path = self._CACHE_DIR / f"{key}.py"
+        code_path = self._CACHE_DIR / f"{key}.{sys.implementation.cache_tag}.marshal"
+        try:
+            code = marshal.loads(code_path.read_bytes())
+        except (OSError, EOFError, ValueError, TypeError):
+            source = self._generate()
+            code = compile(source, str(source_path), "exec")
+            with suppress(OSError):
+                self._CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                source_path.write_text(source, encoding="utf-8")
+                code_path.write_bytes(marshal.dumps(code))
+        namespace: dict = {}
+        exec(code, namespace)
+        self._machine = namespace["make"](self._fail_state)
+
+    def _fail_state(self, state: int, symbol: int) -> NoReturn:
+        self._fail(state * len(self._symbols), symbol)
+
+    def _generate(self) -> str:
+        by_state: dict[int, list[tuple[int, Transition]]] = {}
+        for i, t in enumerate(self._transitions):
+            by_state.setdefault(self._state_ids[t.from_state], []).append((i, t))
+
+        def name(state: int) -> str:
+            return f"s{state}_{re.sub(r'[^0-9A-Za-z_]', '_', self._states[state])}"
+
+        def move(delta: int, indent: str) -> list[str]:
+            if delta > 0:
+                return [
+                    f"{indent}head += 1",
+                    f"{indent}if head == len(tape):",
+                    f"{indent}    tape.extend([0] * len(tape))",
+                ]
+            return [
+                f"{indent}head -= 1",
+                f"{indent}if head < 0:",
+                f"{indent}    grow = len(tape)",
+                f"{indent}    tape[:0] = [0] * grow",
+                f"{indent}    head += grow",
+            ]
+
+        lines = []
+        constants = []
+        for state in range(len(self._states)):
+            if state == self._state_ids["HALT"]:
+                continue
+            lines += [
+                "",
+                f"    def {name(state)}():  # {self._states[state]}",
+                "        nonlocal head, steps, checkpoint",
+                "        symbol = tape[head]",
+            ]
+            rules = by_state.get(state, [])
+            for delta in (1, -1):
+                loops = {
+                    self._symbol_ids[t.symbol]: i
+                    for i, t in rules
+                    if t.to_state == t.from_state
+                    and t.new_symbol == t.symbol
+                    and (1 if t.direction == "R" else -1) == delta
+                }
+                if not loops:
+                    continue
+                if len(loops) == 1:
+                    [(symbol, rule)] = loops.items()
+                    lines += [
+                        f"        if symbol == {symbol}:",
+                        f"            used[{rule}] = 1",
+                        f"            while symbol == {symbol}:",
+                    ]
+                    indent = " " * 16
+                else:
+                    table = f"{name(state)}_{'right' if delta > 0 else 'left'}"
+                    constants.append(f"    {table} = {loops}")
+                    lines += [
+                        f"        while symbol in {table}:",
+                        f"            used[{table}[symbol]] = 1",
+                    ]
+                    indent = " " * 12
+                lines += [
+                    f"{indent}steps += 1",
+                    *move(delta, indent),
+                    f"{indent}symbol = tape[head]",
+                    f"{indent}if steps >= checkpoint:",
+                    f"{indent}    checkpoint = check(steps, {name(state)}, tape, head)",
+                ]
+
+            # Self-loops stay in the dispatch too: a sweep in one direction can end on a symbol that
+            # loops in the other direction, and so on, each of which re-enters the state function.
+            for i, t in rules:
+                symbol = self._symbol_ids[t.symbol]
+                lines += [
+                    f"        if symbol == {symbol}:",
+                    f"            used[{i}] = 1",
+                    f"            tape[head] = {self._symbol_ids[t.new_symbol]}",
+                    "            steps += 1",
+                ]
+                if t.to_state == "HALT":
+                    lines += ["            return None"]
+                else:
+                    lines += [
+                        *move(1 if t.direction == "R" else -1, " " * 12),
+                        f"            return {name(self._state_ids[t.to_state])}",
+                    ]
+            lines += [f"        fail({state}, symbol)"]
+
+        lines = [
+            f"# Generated by utils.CompiledLogicMill from {len(self._transitions)} rules.",
+            "def make(fail):",
+            "    tape = used = check = None",
+            "    head = steps = checkpoint = 0",
+            *constants,
+            *lines,
+            "",
+            "    def run(cells, coverage, on_checkpoint, first_checkpoint):",
+            "        nonlocal tape, used, check, head, steps, checkpoint",
+            "        tape, used, check = cells, coverage, on_checkpoint",
+            "        checkpoint = first_checkpoint",
+            "        head = steps = 0",
+            f"        state = {name(self._state_ids['INIT'])}",
+            "        while state is not None:",
+            "            if steps >= checkpoint:",
+            "                checkpoint = check(steps, state, tape, head)",
+            "            state = state()",
+            "        return tape, steps",
+            "",
+            "    return run",
+            "",
+        ]
+        return "\n".join(lines)
+
+    def run(
+        self,
+        tape: str,
+        verbose: bool = False,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[str, int]:
+        if verbose:
+            return super().run(tape, verbose, max_steps, timeout)
+        self._used = bytearray(len(self._transitions))
+        watchdog = _Watchdog(max_steps, timeout)
+
+        def check(steps: int, state: Callable, cells: list[int], head: int) -> int:
+            return watchdog.check(steps, _configuration(state, cells, head), len(cells))
+
+        cells, steps = self._machine(self._load(tape), self._used, check, watchdog.next_check(0))
+        return self._result(cells), steps
+
+
+class BlockLogicMill(PyLogicMill):
+    """Pure-Python Logic Mill that memoizes the effect of the machine on fixed-size tape blocks.
+
+    The tape is cut into blocks of _BLOCK_SIZE cells, and the head always enters a block at one of
+    its edges. Running the machine until it leaves the block (or halts) only depends on the state,
+    the entry edge and the contents of the block, so the outcome (exit state and edge, new contents,
+    steps taken and rules fired) is kept in an LRU cache, and the machine's repeated sweeps over the
+    same patterns become cache lookups."""
+
+    _BLOCK_SIZE = 16
+    _CACHE_SIZE = 1 << 16
+    # A traversal stops after this many steps even if the head is still in the block, so that the
+    # watchdog gets to see machines that loop within a single block.
+    _MAX_TRAVERSAL = 1 << 10
+
+    def _build(self) -> None:
+        super()._build()
+        self._traverse = lru_cache(maxsize=self._CACHE_SIZE)(self._traverse_block)
+
+    def _traverse_block(
+        self, base: int, head: int, block: bytes
+    ) -> tuple[int, int, bytes, int, tuple[int, ...]]:
+        """Run the machine on a single block, from the given state and head offset, until the head
+        leaves the block, the machine halts or _MAX_TRAVERSAL steps are taken. Returns the final
+        state and head offset, the new contents of the block, the steps taken and the rules that
+        fired."""
+        cells = bytearray(block)
+        table = self._table
+        fired: dict[int, None] = {}
+        steps = 0
+        while 0 <= head < len(cells) and steps < self._MAX_TRAVERSAL:
+            symbol = cells[head]
+            entry = table[base + symbol]
+            if entry is None:
+                self._fail(base, symbol)
+            base, cells[head], delta, rule = entry
+            fired[rule] = None
+            head += delta
+            steps += 1
+            if base < 0:
+                break
+        return base, head, bytes(cells), steps, tuple(fired)
+
+    def run(
+        self,
+        tape: str,
+        verbose: bool = False,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[str, int]:
+        if verbose or len(self._symbols) > 256:
+            return super().run(tape, verbose, max_steps, timeout)
+
+        size = self._BLOCK_SIZE
+        cells = bytearray(self._load(tape))
+        cells.extend(bytes(-len(cells) % size))
+        traverse = self._traverse
+        used = self._used = bytearray(len(self._transitions))
+        watchdog = _Watchdog(max_steps, timeout)
+        base = head = block = steps = 0
+        checkpoint = watchdog.next_check(steps)
+        while True:
+            start = block * size
+            if steps >= checkpoint:
+                configuration = _configuration(base, cells, start + head)
+                checkpoint = watchdog.check(steps, configuration, len(cells))
+            base, head, cells[start : start + size], count, fired = traverse(
+                base, head, bytes(cells[start : start + size])
+            )
+            steps += count
+            for rule in fired:
+                used[rule] = 1
+            if base < 0:
+                break
+            if head < 0:
+                block -= 1
+                head = size - 1
+                if block < 0:
+                    grow = len(cells)
+                    cells[:0] = bytes(grow)
+                    block += grow // size
+            elif head >= size:
+                block += 1
+                head = 0
+                if start + size == len(cells):
+                    cells.extend(bytes(len(cells)))
+        return self._result(cells), steps
+
+
+@runtime_checkable
+class BatchBackend(Backend, Protocol):
+    """A backend that can also run many tapes at once."""
+
+    def run_batch(
+        self, tapes: list[str], max_steps: int | None = None, timeout: float | None = None
+    ) -> list[tuple[str, int] | MachineError]:
+        """Run the machine on each of the tapes, returning their final tapes and step counts, or
+        the MachineError that Backend.run would have raised for the tapes that fail."""
+        ...
+
+    def unused_rules_batch(self) -> list[list[tuple[str, str]]]:
+        """The unused rules of each of the tapes of the last batch."""
+        ...
+
+
+class NumpyLogicMill(PyLogicMill):
+    """Logic Mill that runs a whole batch of tapes in lockstep with NumPy.
+
+    The transition table is compiled into dense arrays indexed by `state * symbol_count + symbol`,
+    all the tapes are kept in one padded 2-D array, and every step advances all the machines that
+    haven't halted yet with a handful of vectorized operations. Once only a few machines are left
+    running, they're finished one by one on the scalar engine, which is faster for long tails."""
+
+    _STRAGGLERS = 4
+
+    def _build(self) -> None:
+        super()._build()
+        defined = [i for i, entry in enumerate(self._table) if entry is not None]
+        entries = np.array([self._table[i] for i in defined], np.int64).reshape(-1, 4)
+        self._np_defined = np.zeros(len(self._table), bool)
+        self._np_defined[defined] = True
+        self._np_next, self._np_write, self._np_delta, self._np_rule = (
+            np.zeros(len(self._table), np.int64) for _ in range(4)
+        )
+        for column, array in enumerate(
+            (self._np_next, self._np_write, self._np_delta, self._np_rule)
+        ):
+            array[defined] = entries[:, column]
+
+    def run(
+        self,
+        tape: str,
+        verbose: bool = False,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[str, int]:
+        if verbose:
+            return super().run(tape, verbose, max_steps, timeout)
+        [result] = self.run_batch([tape], max_steps, timeout)
+        if isinstance(result, MachineError):
+            raise result
+        self._used = bytearray(self._np_used[0])
+        return result
+
+    def run_batch(
+        self, tapes: list[str], max_steps: int | None = None, timeout: float | None = None
+    ) -> list[tuple[str, int] | MachineError]:
+        rows = [self._load(tape) for tape in tapes]
+        watchdogs = [_Watchdog(max_steps, timeout) for _ in rows]
+        margin = max(16, max(map(len, rows), default=0))
+        cells = np.zeros((len(rows), 2 * margin + max(map(len, rows), default=0)), np.int64)
+        for i, row in enumerate(rows):
+            cells[i, margin : margin + len(row)] = row
+        head = np.full(len(rows), margin, np.int64)
+        base = np.zeros(len(rows), np.int64)
+        steps = np.zeros(len(rows), np.int64)
+        used = self._np_used = np.zeros((len(rows), len(self._transitions)), bool)
+
+        active = np.arange(len(rows))
+        # The machines that fail are dropped from the batch, and the others keep going.
+        errors: dict[int, MachineError] = {}
+        # All the machines that are still running have taken the same number of steps.
+        count = 0
+        checkpoint = watchdogs[0].next_check(count) if watchdogs else 0
+        while len(active) > self._STRAGGLERS:
+            if count >= checkpoint:
+                for i in active.tolist():
+                    configuration = _configuration(int(base[i]), cells[i].tolist(), int(head[i]))
+                    try:
+                        checkpoint = watchdogs[i].check(count, configuration, cells.shape[1])
+                    except MachineError as e:
+                        errors[i] = e
+                if errors:
+                    active = active[[i not in errors for i in active.tolist()]]
+                    continue
+            h = head[active]
+            index = base[active] + cells[active, h]
+            if not (ok := self._np_defined[index]).all():
+                for i in np.flatnonzero(~ok).tolist():
+                    try:
+                        self._fail(int(base[active[i]]), int(cells[active[i], h[i]]))
+                    except MachineError as e:
+                        errors[int(active[i])] = e
+                active, h, index = active[ok], h[ok], index[ok]
+            cells[active, h] = self._np_write[index]
+            used[active, self._np_rule[index]] = True
+            base[active] = self._np_next[index]
+            head[active] = h + self._np_delta[index]
+            steps[active] += 1
+            count += 1
+            active = active[base[active] >= 0]
+            if len(active) and (head[active].min() < 0 or head[active].max() >= cells.shape[1]):
+                grow = cells.shape[1]
+                cells = np.pad(cells, ((0, 0), (grow, grow)))
+                head += grow
+
+        results = []
+        symbols = np.array(self._symbols)
+        for i in range(len(rows)):
+            if i in errors:
+                results.append(errors[i])
+                continue
+            if base[i] < 0:
+                row, count = cells[i], int(steps[i])
+                results.append(("".join(symbols[row]).strip(BLANK), count))
+                continue
+            self._used = bytearray(len(self._transitions))
+            try:
+                row, count = self._simulate(
+                    cells[i].tolist(),
+                    int(head[i]),
+                    int(base[i]),
+                    int(steps[i]),
+                    watchdog=watchdogs[i],
+                )
+            except MachineError as e:
+                results.append(e)
+                continue
+            finally:
+                used[i] |= np.frombuffer(self._used, np.uint8).astype(bool)
+            results.append((self._result(row), count))
+        return results
+
+    def unused_rules_batch(self) -> list[list[tuple[str, str]]]:
+        keys = [(t.from_state, t.symbol) for t in self._transitions]
+        return [[keys[i] for i in np.flatnonzero(~row)] for row in self._np_used]
+
+
+BACKENDS: dict[str, Callable[[str], Backend]] = {
+    "py": PyLogicMill,
+    "sweep": SweepLogicMill,
+    "rle": RunLengthLogicMill,
+    "compiled": CompiledLogicMill,
+    "block": BlockLogicMill,
+}
+if mill is not None:
+    BACKENDS["rs"] = mill.LogicMill
+if np is not None:
+    BACKENDS["numpy"] = NumpyLogicMill
+DEFAULT_BACKEND = "rs" if "rs" in BACKENDS else "py"
+
+
+class CaseResult(NamedTuple):
+    """The outcome of running the machine on a single input line, cheap to send between processes."""
+
+    line: str
+    expected_output: str | None
+    result: str
+    steps: int
+    coverage: int
+    """Bitset over rule indices (i.e. line numbers in rules.txt) of the rules that fired, or -1 (every
+    bit set) for a run that was killed before it could tell."""
+    error: str | None = None
+    """Why the machine didn't halt properly, in which case the result is empty."""
+    trace: str | None = None
+    """The file holding the verbose trace of the run, when it was spooled by a worker."""
+    cached: bool = False
+    """Whether the result was handed over from an earlier run of the same tape."""
+
+
+class _Case(NamedTuple):
+    """An input line, split into the tape and the expected output."""
+
+    line: str
+    expected_output: str | None
+    span: tuple[int, int] | None = None
+    """Where the line is in the mapped input file, so that workers can read it from there."""
 
 
-def _do_split(line: str):
+def _rule_keys(rules: str) -> list[tuple[str, str]]:
+    """Return the (state, symbol) pair of each rule, in the order they appear in the rules text."""
+    return [tuple(line.split(" ", 2)[:2]) for line in rules.splitlines()]
+
+
+def _unused_rule_keys(rules: str, used_rules: int) -> list[tuple[str, str]]:
+    """Return the (state, symbol) pairs of the rules whose bit is not set in the given bitset, in
+    the order they appear in the rules text."""
+    keys = _rule_keys(rules)
+    used = (used_rules & ((1 << len(keys)) - 1)).to_bytes((len(keys) + 7) // 8, "little")
+    return [key for i, key in enumerate(keys) if not (used[i >> 3] >> (i & 7)) & 1]
+
+
+_worker_mill: Backend | None = None
+_worker_rule_index: dict[tuple[str, str], int] = {}
+_worker_input: mmap.mmap | bytes = b""
+
+
+def _init_worker(
+    rules: str, backend: str = DEFAULT_BACKEND, input_path: Path | None = None
+) -> None:
+    """Parse the rules once per process, so that every case run there reuses the same machine,
+    and map the input file, if any, so that the cases can be read from there."""
+    global _worker_mill, _worker_rule_index, _worker_input
+    _worker_mill = BACKENDS[backend](rules)
+    _worker_rule_index = {key: i for i, key in enumerate(_rule_keys(rules))}
+    if input_path is not None:
+        _worker_input = _map_file(input_path)
+
+
+def _coverage(unused_rules: list[tuple[str, str]]) -> int:
+    """Turn the machine's unused rules into a bitset of the rules that were used instead."""
+    unused = bytearray((len(_worker_rule_index) + 7) // 8)
+    for rule in unused_rules:
+        i = _worker_rule_index[rule]
+        unused[i >> 3] |= 1 << (i & 7)
+    return ~int.from_bytes(unused, "little") & ((1 << len(_worker_rule_index)) - 1)
+
+
+@contextmanager
+def _redirect_stdout(fd: int) -> Iterator[None]:
+    """Send everything written to the standard output, by Python or native code, to the given
+    file descriptor, which is closed afterwards."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(fd, 1)
+    os.close(fd)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def _print_trace(path: str) -> None:
+    """Print a trace spooled by a worker, and delete it."""
+    sys.stdout.flush()
+    with open(path, "rb") as f:
+        shutil.copyfileobj(f, sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+    os.remove(path)
+
+
+def _do_run(
+    item: _Case,
+    quiet: bool,
+    track_coverage: bool,
+    max_steps: int | None = None,
+    timeout: float | None = None,
+    trace_dir: str | None = None,
+) -> CaseResult:
+    if trace_dir is not None:
+        fd, trace = tempfile.mkstemp(dir=trace_dir)
+        with _redirect_stdout(fd):
+            case = _do_run(item, quiet, track_coverage, max_steps, timeout)
+        return case._replace(trace=trace)
+
+    line, expected_output, _ = item
+    assert _worker_mill is not None, "_init_worker must be called before _do_run"
+    # Only the Python backends can stop a run midway; the others are checked once they're done.
+    budget = (
+        {"max_steps": max_steps, "timeout": timeout}
+        if isinstance(_worker_mill, PyLogicMill)
+        else {}
+    )
+    tape = line.strip()
+    try:
+        if quiet and "{" in tape and isinstance(_worker_mill, RunLengthLogicMill):
+            # Compact tapes go straight to the run-length backend, and so does its output.
+            runs, steps = _worker_mill.run_runs(tape_runs(tape), max_steps, timeout)
+            result = compact_tape(runs)
+        else:
+            result, steps = _worker_mill.run(expand_tape(tape), verbose=not quiet, **budget)
+        _check_steps(steps, max_steps)
+    except Exception as e:
+        # The rules that fired before the run failed still count as used.
+        coverage = _coverage(_worker_mill.unused_rules()) if track_coverage else 0
+        return CaseResult(line, expected_output, "", 0, coverage, error=str(e))
+    coverage = _coverage(_worker_mill.unused_rules()) if track_coverage else 0
+    return CaseResult(line, expected_output, result, steps, coverage)
+
+
+def _do_run_batch(
+    items: list[_Case],
+    quiet: bool,
+    track_coverage: bool,
+    max_steps: int | None = None,
+    timeout: float | None = None,
+    trace_dir: str | None = None,
+) -> list[CaseResult]:
+    if not quiet or not isinstance(_worker_mill, BatchBackend):
+        return [
+            _do_run(item, quiet, track_coverage, max_steps, timeout, trace_dir) for item in items
+        ]
+    try:
+        outcomes = _worker_mill.run_batch(
+            [expand_tape(item.line.strip()) for item in items], max_steps, timeout
+        )
+    except Exception:
+        # Failing cases come back on their own, so this is a bug: find out which case hits it.
+        return [_do_run(item, quiet, track_coverage, max_steps, timeout) for item in items]
+    unused = _worker_mill.unused_rules_batch() if track_coverage else [None] * len(items)
+    results = []
+    for (line, expected_output, _), outcome, u in zip(items, outcomes, unused):
+        coverage = 0 if u is None else _coverage(u)
+        try:
+            if isinstance(outcome, MachineError):
+                raise outcome
+            result, steps = outcome
+            _check_steps(steps, max_steps)
+        except MachineError as e:
+            results.append(CaseResult(line, expected_output, "", 0, coverage, error=str(e)))
+            continue
+        results.append(CaseResult(line, expected_output, result, steps, coverage))
+    return results
+
+
+def _do_run_spans(spans: list[tuple[int, int]], **options) -> list[CaseResult]:
+    """Like _do_run_batch, for the cases at the given offsets of the mapped input file."""
+    return _do_run_batch([_read_case(_worker_input, span) for span in spans], **options)
+
+
+def _do_split(line: str, span: tuple[int, int] | None = None) -> _Case:
     if " => " in line:
         line, expected_output = line.split(" => ", 1)
     else:
         expected_output = None
-    return line, expected_output
+    return _Case(line, expected_output, span)
+
+
+def _map_file(path: Path) -> mmap.mmap | bytes:
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return b""  # Empty files can't be mapped.
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_case(data: mmap.mmap | bytes, span: tuple[int, int]) -> _Case:
+    start, end = span
+    return _do_split(data[start:end].decode("utf-8").rstrip("\r\n"), span)
+
+
+def _open_compressed(path: Path) -> TextIO:
+    """Open a gzip or zstd compressed input file, to read its lines as text."""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if zstandard is None:
+        raise ImportError(f"The zstandard package is needed to read {path}")
+    return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), "utf-8")
+
+
+class _Corpus:
+    """An input file mapped into memory, along with the offsets at which each of its lines starts.
+
+    The offsets are saved next to the file (as .<name>.idx) and only rebuilt when the size or the
+    modification time of the file change, so that any selection of lines can be read right away
+    however large the corpus is."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.data = _map_file(path)
+        self.offsets = self._load_offsets()
+
+    def _load_offsets(self) -> array:
+        stat = self.path.stat()
+        header = array("Q", [stat.st_size, stat.st_mtime_ns])
+        index_path = self.path.with_name(f".{self.path.name}.idx")
+        with suppress(OSError, ValueError):
+            offsets = array("Q")
+            offsets.frombytes(index_path.read_bytes())
+            if offsets[:2] == header:
+                return offsets[2:]
+
+        offsets = array("Q", [0])
+        offsets.extend(match.end() for match in re.finditer(rb"\n", self.data))
+        if offsets[-1] != len(self.data):  # The last line has no newline.
+            offsets.append(len(self.data))
+        with suppress(OSError):
+            index_path.write_bytes((header + offsets).tobytes())
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> _Case:
+        return _read_case(self.data, (self.offsets[i], self.offsets[i + 1]))
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+class _CostModel:
+    """Estimates how many steps a case will take, so that the expensive ones can be started first.
+
+    Known step counts (from `hint`) are used as-is; for other tapes the estimate is the tape length
+    until enough cases have been recorded, and a power law steps ≈ a·length^b fitted on them after.
+    """
+
+    def __init__(self, hint: Callable[[str], int | None] = lambda tape: None) -> None:
+        self.hint = hint
+        self._n = self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def record(self, tape: str, steps: int) -> None:
+        x, y = math.log1p(tape_length(tape)), math.log1p(steps)
+        self._n += 1
+        self._sx += x
+        self._sy += y
+        self._sxx += x * x
+        self._sxy += x * y
+
+    def estimate(self, tape: str) -> float:
+        if (steps := self.hint(tape)) is not None:
+            return steps
+        length = tape_length(tape)
+        denominator = self._n * self._sxx - self._sx * self._sx
+        if self._n < 2 or denominator <= 1e-9:
+            return length + 1
+        b = (self._n * self._sxy - self._sx * self._sy) / denominator
+        a = (self._sy - b * self._sx) / self._n
+        return math.exp(a + b * math.log1p(length))
+
+
+_MAX_CHUNK_SIZE = 256
+_RECENT_RESULTS = 1 << 12
+# The --timeout of the backends that can't stop a run midway, so that a case looping forever can't
+# hang them.
+_DEFAULT_TIMEOUT = 60.0
+
+
+def _fan_out(case: CaseResult, item: _Case) -> CaseResult:
+    """Hand a result over to another input line with the same tape."""
+    if (case.line, case.expected_output) == item[:2]:
+        return case
+    return case._replace(line=item.line, expected_output=item.expected_output)
+
+
+def _imap_scheduled(
+    executor: Executor,
+    fn: Callable[..., list[CaseResult]],
+    items: Iterable[_Case],
+    cost: Callable[[_Case], float],
+    jobs: int,
+    window: int,
+    lookup: Callable[[_Case], CaseResult | None] | None = None,
+    pack: Callable[[list[_Case]], object] = list,
+    merge_repeats: bool = True,
+) -> Iterator[CaseResult]:
+    """Run `fn` over batches of `items` in the executor, yielding results in input order.
+
+    Items are read `window` at a time. Within a window the most expensive ones (according to
+    `cost`) are submitted first and on their own, while the cheap ones are grouped into chunks of
+    roughly equal total cost, so that neither per-task overhead nor a few huge cases at the end of
+    the input leave the pool idle. The next window is submitted before the previous one is drained,
+    so at most two windows are held in memory at a time. Items for which `lookup` already has a
+    result are never submitted at all, and neither are the repeats of a tape within a window unless
+    `merge_repeats` is off (as each verbose case needs its own trace). What `fn` is actually sent
+    for a batch is up to `pack`."""
+    items = iter(items)
+    in_flight: deque[tuple[list, list[tuple[Future[list[CaseResult]], int]]]] = deque()
+
+    def submit(batch: list[_Case]) -> list[tuple[Future[list[CaseResult]], int]]:
+        slots: list = [None] * len(batch)
+        misses: list[int] = []
+        first: dict[str, int] = {}
+        repeats: list[tuple[int, int]] = []
+        for i, item in enumerate(batch):
+            if lookup is not None and (hit := lookup(item)) is not None:
+                slots[i] = (future := Future(), 0, False)
+                future.set_result([hit])
+            elif merge_repeats and (j := first.setdefault(item.line.strip(), i)) != i:
+                repeats.append((i, j))
+            else:
+                misses.append(i)
+
+        costs = {i: cost(batch[i]) for i in misses}
+        target = sum(costs.values()) / (4 * jobs)
+        chunks: list[list[int]] = [[]]
+        chunk_cost = 0.0
+        for i in sorted(misses, key=costs.__getitem__, reverse=True):
+            if chunk_cost >= target or len(chunks[-1]) >= _MAX_CHUNK_SIZE:
+                chunks.append([])
+                chunk_cost = 0.0
+            chunks[-1].append(i)
+            chunk_cost += costs[i]
+
+        for chunk in filter(None, chunks):
+            future = executor.submit(fn, pack([batch[i] for i in chunk]))
+            for j, i in enumerate(chunk):
+                slots[i] = (future, j, False)
+        for i, j in repeats:
+            slots[i] = (*slots[j][:2], True)
+        return slots
+
+    def drain(batch: list[_Case], slots: list) -> Iterator[CaseResult]:
+        for item, (future, j, repeat) in zip(batch, slots):
+            case = future.result()[j]
+            yield _fan_out(case._replace(cached=True) if repeat else case, item)
+
+    try:
+        while batch := list(islice(items, window)):
+            in_flight.append((batch, submit(batch)))
+            if len(in_flight) > 1:
+                yield from drain(*in_flight.popleft())
+        while in_flight:
+            yield from drain(*in_flight.popleft())
+    finally:
+        for _, slots in in_flight:
+            for future, *_ in slots:
+                future.cancel()
+
+
+def _terminate(executor: ProcessPoolExecutor) -> None:
+    """Shut the executor down right away, cancelling the queued tasks and killing the workers
+    that are still busy with theirs."""
+    # There's no public way to stop a running task, so reach for the worker processes themselves.
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+class _Pool(Executor):
+    """A process pool that can be torn down and started afresh, which is the only way to get a
+    worker off a run that can't be stopped from within."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._args, self._kwargs = args, kwargs
+        self.executor = ProcessPoolExecutor(*args, **kwargs)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def restart(self) -> None:
+        _terminate(self.executor)
+        self.executor = ProcessPoolExecutor(*self._args, **self._kwargs)
+
+    def terminate(self) -> None:
+        _terminate(self.executor)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self.executor.shutdown(wait, cancel_futures=cancel_futures)
+
+
+def _imap_deadline(
+    pool: _Pool,
+    fn: Callable[..., list[CaseResult]],
+    items: Iterable[_Case],
+    jobs: int,
+    timeout: float,
+    lookup: Callable[[_Case], CaseResult | None] | None = None,
+    pack: Callable[[list[_Case]], object] = list,
+) -> Iterator[CaseResult]:
+    """The counterpart of _imap_scheduled for backends that can't stop a run midway, which
+    enforces the `timeout` of each case from the outside instead.
+
+    Never more chunks are submitted than there are workers, so that each starts right when it's
+    submitted, and a chunk must finish within the timeout. Chunks start out as single cases and
+    double in size for as long as they finish quickly. One that runs past the timeout has its cases
+    submitted again one by one, and a single case that does fails; its worker can only be killed
+    along with the whole pool, so the pool is started afresh and the other chunks that were running
+    are submitted again."""
+    items = iter(items)
+    # [item, (future, index) or result] for each item, in input order.
+    pending: deque[list] = deque()
+    # The entries waiting for a worker, with those to be retried on their own kept apart.
+    queue: deque[list] = deque()
+    retry: deque[list] = deque()
+    running: dict[Future[list[CaseResult]], tuple[list[list], float]] = {}
+    chunk_size = 1
+
+    def submit(entries: list[list]) -> None:
+        future = pool.submit(fn, pack([entry[0] for entry in entries]))
+        for j, entry in enumerate(entries):
+            entry[1] = (future, j)
+        running[future] = (entries, time.monotonic())
+
+    def sweep() -> None:
+        nonlocal chunk_size
+        now = time.monotonic()
+        for future in [future for future in running if future.done()]:
+            entries, started = running.pop(future)
+            if len(entries) == chunk_size and (now - started) * 64 < timeout:
+                chunk_size = min(2 * chunk_size, _MAX_CHUNK_SIZE)
+
+    def fill() -> None:
+        sweep()
+        while len(running) < jobs:
+            if retry:
+                submit([retry.popleft()])
+                continue
+            while len(queue) < chunk_size and len(pending) < 2 * jobs * _MAX_CHUNK_SIZE:
+                if (item := next(items, None)) is None:
+                    break
+                pending.append(entry := [item, None if lookup is None else lookup(item)])
+                if entry[1] is None:
+                    queue.append(entry)
+            if not queue:
+                return
+            submit([queue.popleft() for _ in range(min(chunk_size, len(queue)))])
+
+    def expire() -> None:
+        nonlocal chunk_size
+        oldest = min(started for _, started in running.values())
+        wait(running, max(0.0, oldest + timeout - time.monotonic()), FIRST_COMPLETED)
+        sweep()
+        now = time.monotonic()
+        if not (expired := [f for f, (_, started) in running.items() if now - started > timeout]):
+            return
+        chunk_size = 1
+        for future in expired:
+            entries, _ = running.pop(future)
+            if len(entries) > 1:
+                retry.extend(entries)
+                continue
+            line, expected_output, _ = entries[0][0]
+            entries[0][1] = CaseResult(
+                line, expected_output, "", 0, -1, error=f"Timed out after {timeout}s"
+            )
+        interrupted = [entry for entries, _ in running.values() for entry in entries]
+        running.clear()
+        pool.restart()
+        queue.extendleft(reversed(interrupted))
+
+    try:
+        fill()
+        while pending:
+            item, outcome = pending[0]
+            if not isinstance(outcome, CaseResult):
+                if outcome is None or not outcome[0].done():
+                    expire()
+                    fill()
+                    continue
+                outcome = outcome[0].result()[outcome[1]]
+            pending.popleft()
+            fill()
+            yield _fan_out(outcome, item)
+    finally:
+        for future in running:
+            future.cancel()
+
+
+def _imap_serial(
+    fn: Callable[[list[_Case]], list[CaseResult]],
+    items: Iterable[_Case],
+    batch_size: int = 1,
+    lookup: Callable[[_Case], CaseResult | None] | None = None,
+) -> Iterator[CaseResult]:
+    """The in-process counterpart of _imap_scheduled, running `batch_size` items at a time."""
+    items = iter(items)
+    while batch := list(islice(items, batch_size)):
+        hits = [None if lookup is None else lookup(item) for item in batch]
+        misses: dict[str, _Case] = {}
+        for item, hit in zip(batch, hits):
+            if hit is None:
+                misses.setdefault(item.line.strip(), item)
+        computed = dict(zip(misses, fn(list(misses.values())) if misses else ()))
+        for item, hit in zip(batch, hits):
+            if hit is not None:
+                yield hit
+                continue
+            tape = item.line.strip()
+            yield _fan_out(computed[tape], item)
+            computed[tape] = computed[tape]._replace(cached=True)
+
+
+class _RecentResults:
+    """Keeps the results of the last `size` distinct tapes, so that a tape that comes up again
+    later in the input is handed the same result instead of being simulated again.
+
+    Entries are keyed by a digest of the tape and hold only the output, steps and error: the
+    coverage of a repeat adds nothing to that of the first run, so its result is handed out with
+    an empty one. Anything older is left to the on-disk cache."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._results: OrderedDict[bytes, tuple[str, int, str | None]] = OrderedDict()
+
+    @staticmethod
+    def _key(tape: str) -> bytes:
+        return hashlib.blake2b(tape.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, item: _Case) -> CaseResult | None:
+        key = self._key(item.line.strip())
+        if (entry := self._results.get(key)) is None:
+            return None
+        self._results.move_to_end(key)
+        result, steps, error = entry
+        return CaseResult(item.line, item.expected_output, result, steps, 0, error, cached=True)
+
+    def put(self, case: CaseResult) -> None:
+        key = self._key(case.line.strip())
+        self._results[key] = (case.result, case.steps, case.error)
+        self._results.move_to_end(key)
+        if len(self._results) > self.size:
+            self._results.popitem(last=False)
+
+
+class _ResultCache:
+    """On-disk cache of case results, keyed by the hash of the rules and the input tape.
+
+    Results computed without coverage are stored with a NULL coverage, and don't count as hits when
+    coverage is being tracked. Steps taken on the same tape under any previous version of the rules
+    are also handed out as hints for the scheduler's cost model."""
+
+    _FLUSH_EVERY = 1024
+
+    def __init__(self, path: Path, rules: str, track_coverage: bool) -> None:
+        self.rules_hash = hashlib.sha256(rules.encode("utf-8")).hexdigest()
+        self.rule_count = len(rules.splitlines())
+        self.track_coverage = track_coverage
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                rules_hash TEXT NOT NULL,
+                tape TEXT NOT NULL,
+                result TEXT NOT NULL,
+                steps INTEGER NOT NULL,
+                coverage BLOB,
+                PRIMARY KEY (rules_hash, tape)
+            );
+            CREATE INDEX IF NOT EXISTS results_tape ON results (tape);
+            """
+        )
+        self._pending: list[tuple[str, str, str, int, bytes | None]] = []
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.flush()
+        self.db.close()
+
+    def get(self, item: _Case, max_steps: int | None = None) -> CaseResult | None:
+        """Look up the result of a case, unless it took more than `max_steps` steps: those have
+        to be run again to fail with the proper error."""
+        line, expected_output, _ = item
+        row = self.db.execute(
+            "SELECT result, steps, coverage FROM results WHERE rules_hash = ? AND tape = ?",
+            (self.rules_hash, line.strip()),
+        ).fetchone()
+        if row is None or (self.track_coverage and row[2] is None):
+            return None
+        if max_steps is not None and row[1] > max_steps:
+            return None
+        result, steps, coverage = row
+        coverage = 0 if coverage is None else int.from_bytes(coverage, "little")
+        return CaseResult(line, expected_output, result, steps, coverage, cached=True)
+
+    def put(self, case: CaseResult) -> None:
+        coverage = (
+            case.coverage.to_bytes((self.rule_count + 7) // 8, "little")
+            if self.track_coverage
+            else None
+        )
+        self._pending.append((self.rules_hash, case.line.strip(), case.result, case.steps, coverage))
+        if len(self._pending) >= self._FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        # Never overwrite an entry that has coverage with one that doesn't.
+        self.db.executemany(
+            "INSERT INTO results VALUES (?, ?, ?, ?, ?) ON CONFLICT DO UPDATE"
+            " SET coverage = excluded.coverage WHERE excluded.coverage IS NOT NULL",
+            self._pending,
+        )
+        self.db.commit()
+        self._pending.clear()
+
+    def steps_hint(self, tape: str) -> int | None:
+        row = self.db.execute("SELECT steps FROM results WHERE tape = ? LIMIT 1", (tape,)).fetchone()
+        return None if row is None else row[0]
+
+
+class _Sample:
+    """A reproducible sample of the input cases, stratified by tape length, from which the steps
+    taken on the whole input are extrapolated.
+
+    The cases are sorted by tape length and cut into strata of equal size, each of which gets two
+    cases so that its variance can be estimated, and its share of the rest of the sample. The total
+    is then estimated with the usual stratified estimator, along with its 95% confidence interval.
+    Failed runs have no meaningful step count, so they're left out of the estimate, which is then
+    biased towards the cases that do halt."""
+
+    _STRATA = 10
+
+    def __init__(self, lengths: list[int], size: int, seed: int) -> None:
+        rng = random.Random(seed)
+        self.population = len(lengths)
+        size = min(size, self.population)
+        order = sorted(range(self.population), key=lengths.__getitem__)
+        strata = max(1, min(self._STRATA, size // 2))
+        stratums = [
+            order[h * self.population // strata : (h + 1) * self.population // strata]
+            for h in range(strata)
+        ]
+        self.sizes = [len(stratum) for stratum in stratums]
+        chosen: dict[int, int] = {}
+        for h, (stratum, share) in enumerate(zip(stratums, self._allocate(size, self.sizes))):
+            for i in rng.sample(stratum, share):
+                chosen[i] = h
+        # Run the sample in input order, remembering which stratum each case belongs to.
+        self.indices = sorted(chosen)
+        self._strata = iter([chosen[i] for i in self.indices])
+        self.steps: list[list[int]] = [[] for _ in range(strata)]
+        self.failures = 0
+
+    @staticmethod
+    def _allocate(size: int, sizes: list[int]) -> list[int]:
+        """Split `size` cases between strata of the given sizes: two each (if they have them), and
+        the rest in proportion to the room they have left, by largest remainder."""
+        shares = [min(2, n) for n in sizes]
+        while (spare := size - sum(shares)) > 0 and (room := sum(sizes) - sum(shares)):
+            quotas = [spare * (n - share) / room for n, share in zip(sizes, shares)]
+            extra = [int(quota) for quota in quotas]
+            by_remainder = sorted(range(len(sizes)), key=lambda h: extra[h] - quotas[h])
+            for h in by_remainder[: spare - sum(extra)]:
+                extra[h] += extra[h] < sizes[h] - shares[h]
+            shares = [share + e for share, e in zip(shares, extra)]
+        return shares
+
+    def record(self, steps: int, failed: bool = False) -> None:
+        """Record the steps taken by the next case of the sample, in input order."""
+        h = next(self._strata)
+        if failed:
+            self.failures += 1
+        else:
+            self.steps[h].append(steps)
+
+    def estimate(self) -> tuple[float, float]:
+        """The estimated total steps of the whole input, and the half-width of its 95% CI."""
+        total = variance = 0.0
+        for size, steps in zip(self.sizes, self.steps):
+            if not steps:
+                continue
+            total += size * statistics.fmean(steps)
+            if len(steps) > 1:
+                variance += size * (size - len(steps)) * statistics.variance(steps) / len(steps)
+        return total, 1.96 * math.sqrt(variance)
+
+
+class _Report:
+    """Prints each case as soon as it's available, keeping only running aggregates around."""
+
+    def __init__(self, failing_only: bool) -> None:
+        self.failing_only = failing_only
+        self.cases = 0
+        self.checked = 0
+        self.passed = 0
+        self.total_steps = 0
+        self.used_rules: int | None = None
+        self.errors = 0
+        self.failures = 0
+        self.stopped_early = False
+        self.had_failing = False
+        self.sample: _Sample | None = None
+        self.dead_rules = 0
+        self.pruned = False
+
+    def case(self, case: CaseResult) -> None:
+        line, expected_output, result, steps, coverage, error, *_ = case
+        self.cases += 1
+        self.total_steps += steps
+        self.used_rules = coverage if self.used_rules is None else self.used_rules | coverage
+        self.errors += error is not None
+
+        passed = error is None and expected_output is not None
+        passed = passed and same_tape(expected_output.strip(), result.strip())
+        if expected_output is not None:
+            self.checked += 1
+            self.passed += passed
+        self.failures += not passed and (error is not None or expected_output is not None)
+        if self.failing_only and passed:
+            return
+        self.had_failing = True
+        self._write_case(case, passed)
+
+    def _write_case(self, case: CaseResult, passed: bool) -> None:
+        line, expected_output, result, steps, _, error, *_ = case
+        lines = [
+            f"\x1b[1mInput tape\x1b[0m: {line.strip()}{f' ({n})' if (n := count_unary(line.strip())) is not None else ''}"
+        ]
+        if error is not None:
+            lines.append(f"\x1b[1mError\x1b[0m: {RED}{error}\x1b[0m")
+        else:
+            lines.append(
+                f"\x1b[1mOutput tape\x1b[0m: {result.strip()}{f' ({n})' if (n := count_unary(result.strip())) is not None else ''}"
+            )
+        lines.append(f"\x1b[1mSteps taken\x1b[0m: {steps:_}")
+        expected_output_color = GREEN if passed else RED
+        lines.append(
+            f"\x1b[1mExpected output\x1b[0m: {expected_output_color}{expected_output.strip() if expected_output is not None else 'N/A'}{f' ({n})' if expected_output is not None and (n := count_unary(expected_output.strip())) is not None else ''}\x1b[0m"
+        )
+        # Each tqdm.write clears and redraws the progress bar, which is only needed when both share
+        # the terminal.
+        text = "\n".join(lines) + "\n"
+        if sys.stdout.isatty():
+            tqdm.write(text)
+        else:
+            print(text)
+
+    def summary(self, rules: str, state_count: int, track_coverage: bool) -> None:
+        if not self.had_failing and self.failing_only:
+            print(f"{GREEN}All {self.cases} cases passed! \x1b[0m")
+            print()
+
+        if self.stopped_early:
+            print(f"{RED}Stopped at the first failing case.\x1b[0m")
+            print()
+
+        print(f"\x1b[1mRule count\x1b[0m: {len(rules.splitlines())}")
+
+        rule_size_color = GREEN if len(rules) <= 170_000 else RED
+        print(
+            f"\x1b[1mRule size\x1b[0m: {rule_size_color}{len(rules):_} ({len(rules) / 170000:.2%})\x1b[0m"
+        )
+        state_count_color = (
+            GREEN if state_count <= 1024 else YELLOW if state_count <= 2**16 else RED
+        )
+        print(f"\x1b[1mState count\x1b[0m: {state_count_color}{state_count}\x1b[0m")
+
+        if self.dead_rules:
+            print(
+                f"\x1b[1mDead rules\x1b[0m: {YELLOW if not self.pruned else GREEN}{self.dead_rules}"
+                f"{' (pruned)' if self.pruned else ''}\x1b[0m"
+            )
+
+        if self.checked:
+            passed_color = GREEN if self.passed == self.checked else RED
+            print(f"\x1b[1mPassed cases\x1b[0m: {passed_color}{self.passed}/{self.checked}\x1b[0m")
+
+        if self.errors:
+            print(f"\x1b[1mFailed runs\x1b[0m: {RED}{self.errors}/{self.cases}\x1b[0m")
+
+        if self.sample is not None and self.sample.population:
+            total, error = self.sample.estimate()
+            population = self.sample.population
+            failures = self.sample.failures
+            print(
+                f"\x1b[1mTotal steps\x1b[0m: ~{total:_.0f} ± {error:_.0f}"
+                f" (95% CI, from {self.cases - failures}/{population} cases"
+                + (f", leaving out {failures} failed runs)" if failures else ")")
+            )
+            print(
+                f"\x1b[1mAverage steps\x1b[0m: ~{total / population:_.2f}"
+                f" ± {error / population:_.2f}"
+            )
+        else:
+            print(f"\x1b[1mTotal steps\x1b[0m: {self.total_steps:_}")
+
+            if self.cases:
+                print(f"\x1b[1mAverage steps\x1b[0m: {self.total_steps / self.cases:_.2f}")
+
+        if self.used_rules is None or not track_coverage or self.stopped_early:
+            return
+        unused_rules = _unused_rule_keys(rules, self.used_rules)
+        if unused_rules:
+            print(f"\n\x1b[1mUnused rules\x1b[0m: {len(unused_rules)}/{len(rules.splitlines())}")
+            dedup = {}
+            for state, symbol in unused_rules:
+                if m := re.match(r"(\w+)_(\d+)$", state):
+                    dedup.setdefault((m.group(1), symbol), set()).add(int(m.group(2)))
+                else:
+                    dedup.setdefault((state, symbol), set()).add(None)
+            for state, rules in sorted(dedup.items()):
+                print(
+                    f"  {state[0]} {state[1]}  " + str(sorted(rules) if None not in rules else "✨")
+                )
+
+
+class _JsonLinesReport(_Report):
+    """Streams a JSON object per case, then one for the summary, for scripts to consume."""
+
+    def _record(self, case: CaseResult, passed: bool) -> dict:
+        return {
+            "input": case.line.strip(),
+            "output": None if case.error is not None else case.result.strip(),
+            "expected": None if case.expected_output is None else case.expected_output.strip(),
+            "steps": case.steps,
+            "pass": passed if case.expected_output is not None or case.error is not None else None,
+            "error": case.error,
+        }
+
+    def _totals(self, rules: str, state_count: int, track_coverage: bool) -> dict:
+        totals = {
+            "rule_count": len(rules.splitlines()),
+            "rule_size": len(rules),
+            "state_count": state_count,
+            "dead_rules": self.dead_rules,
+            "pruned": self.pruned,
+            "cases": self.cases,
+            "checked": self.checked,
+            "passed": self.passed,
+            "errors": self.errors,
+            "stopped_early": self.stopped_early,
+            "total_steps": self.total_steps,
+            "average_steps": self.total_steps / self.cases if self.cases else None,
+            "unused_rules": None,
+        }
+        if self.sample is not None and self.sample.population:
+            total, error = self.sample.estimate()
+            totals["total_steps"] = round(total)
+            totals["total_steps_error"] = round(error)
+            totals["average_steps"] = total / self.sample.population
+            totals["sample_failures"] = self.sample.failures
+        if self.used_rules is not None and track_coverage and not self.stopped_early:
+            totals["unused_rules"] = [
+                f"{state} {symbol}" for state, symbol in _unused_rule_keys(rules, self.used_rules)
+            ]
+        return totals
+
+    def _write_case(self, case: CaseResult, passed: bool) -> None:
+        print(json.dumps({"type": "case", **self._record(case, passed)}), flush=True)
+
+    def summary(self, rules: str, state_count: int, track_coverage: bool) -> None:
+        totals = self._totals(rules, state_count, track_coverage)
+        print(json.dumps({"type": "summary", **totals}), flush=True)
+
+
+class _CsvReport(_JsonLinesReport):
+    """Streams a CSV row per case; the summary doesn't fit the columns, so it goes to stderr."""
+
+    _FIELDS = ("input", "output", "expected", "steps", "pass", "error")
+
+    def __init__(self, failing_only: bool) -> None:
+        super().__init__(failing_only)
+        self._writer = csv.DictWriter(sys.stdout, self._FIELDS, lineterminator="\n")
+        self._writer.writeheader()
+
+    def _write_case(self, case: CaseResult, passed: bool) -> None:
+        self._writer.writerow(self._record(case, passed))
+        sys.stdout.flush()
+
+    def summary(self, rules: str, state_count: int, track_coverage: bool) -> None:
+        with redirect_stdout(sys.stderr):
+            _Report.summary(self, rules, state_count, track_coverage)
+
+
+_REPORTS: dict[str, type[_Report]] = {
+    "text": _Report,
+    "jsonl": _JsonLinesReport,
+    "csv": _CsvReport,
+}
+
+
+def _write_if_changed(path: Path, content: str) -> bool:
+    """Writes the file unless it already has this content, so its mtime only moves on changes."""
+    data = content.encode("utf-8")
+    with suppress(FileNotFoundError):
+        if hashlib.sha256(path.read_bytes()).digest() == hashlib.sha256(data).digest():
+            return False
+    path.write_bytes(data)
+    return True
+
+
+def _render_dot(transitions: Sequence[Transition]) -> str:
+    """Renders the rules as a Graphviz digraph, with an edge per pair of states."""
+    out = [
+        "digraph G {",
+        '  rankdir="LR";',
+        '  node [shape=circle, fontname="monospace"];',
+        '  edge [fontname="monospace"];',
+        '  "INIT" [shape=doublecircle, style=filled, fillcolor=lightgrey, rank=min];',
+    ]
+    groups = {}
+    for transition in transitions:
+        groups.setdefault((transition.from_state, transition.to_state), []).append(
+            (transition.symbol, transition.new_symbol, transition.direction)
+        )
+    for (from_state, to_state), items in groups.items():
+        label = "\\n".join(f"{s}→{ns} {d}" for s, ns, d in items)
+        if all(d == "L" for _, _, d in items):
+            color = "blue"
+        elif all(d == "R" for _, _, d in items):
+            color = "red"
+        else:
+            color = "black"
+        out.append(f'  "{from_state}" -> "{to_state}" [label="{label}", color={color}];')
+    out.append('  "HALT" [shape=doublecircle, style=filled, fillcolor=lightgrey, rank=max];')
+    out.append("}")
+    return "\n".join(out) + "\n"
+
+
+def _positive_int(value: str) -> int:
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}") from None
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {n}")
+    return n
+
+
+def _sample_size(value: str) -> int:
+    n = _positive_int(value)
+    if n < 2:
+        raise argparse.ArgumentTypeError("a sample needs at least 2 cases to estimate a variance")
+    return n
+
+
+def _parse_shard(value: str) -> tuple[int, int]:
+    try:
+        shard, shards = map(int, value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {value!r}") from None
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f"shard {shard} is not in 0..{shards - 1}")
+    return shard, shards
+
+
+class _TransitionStore:
+    """The rules of a Program, as columns of interned ids indexed by their (state, symbol) pair.
+
+    Adding a rule that's already there only moves its location to the newer one, and adding one
+    that does something else for the same state and symbol raises a ValueError.
+    """
+
+    def __init__(self) -> None:
+        self.states: list[str] = []
+        self.symbols: list[str] = []
+        self._files: list[str] = []
+        self._state_ids: dict[str, int] = {}
+        self._symbol_ids: dict[str, int] = {}
+        self._file_ids: dict[str, int] = {}
+        # Sorting by state names like FOO_123 is by ("FOO", 123), computed once per state.
+        self._state_keys: list[tuple[str, int, str]] = []
+        self.from_states = array("I")
+        self.read_symbols = array("I")
+        self.to_states = array("I")
+        self.new_symbols = array("I")
+        self.directions = bytearray()
+        self._location_files = array("I")
+        self._location_lines = array("I")
+        self._index: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.from_states)
+
+    @staticmethod
+    def _intern(ids: dict[str, int], names: list[str], name: str) -> int:
+        if (i := ids.get(name)) is None:
+            i = ids[name] = len(names)
+            names.append(name)
+        return i
+
+    def _state(self, name: str) -> int:
+        if (i := self._state_ids.get(name)) is None:
+            i = self._intern(self._state_ids, self.states, name)
+            self._state_keys.append((*base_and_suffix(name), name))
+        return i
+
+    def add(
+        self,
+        from_state: str,
+        symbol: str,
+        to_state: str,
+        new_symbol: str,
+        direction: Literal["L", "R"],
+        location: tuple[str, int],
+    ) -> None:
+        state = self._state(from_state)
+        read = self._intern(self._symbol_ids, self.symbols, symbol)
+        target = self._state(to_state)
+        write = self._intern(self._symbol_ids, self.symbols, new_symbol)
+        move = ord(direction)
+        file = self._intern(self._file_ids, self._files, location[0])
+
+        key = state << 32 | read
+        if (row := self._index.get(key)) is None:
+            self._index[key] = row = len(self.from_states)
+            self.from_states.append(state)
+            self.read_symbols.append(read)
+            self.to_states.append(target)
+            self.new_symbols.append(write)
+            self.directions.append(move)
+            self._location_files.append(file)
+            self._location_lines.append(location[1])
+            return
+
+        if (self.to_states[row], self.new_symbols[row], self.directions[row]) != (
+            target,
+            write,
+            move,
+        ):
+            raise ValueError(
+                f"Conflicting rules for {from_state} {symbol}:"
+                f" {' '.join(self.transition(row))} at {':'.join(map(str, self.location(row)))}"
+                f" and {from_state} {symbol} {to_state} {new_symbol} {direction}"
+                f" at {location[0]}:{location[1]}"
+            )
+        self._location_files[row] = file
+        self._location_lines[row] = location[1]
+
+    def extend(
+        self, rules: Iterable[tuple[str, str, str, str, str]], location: tuple[str, int]
+    ) -> None:
+        """Adds many rules from the same location, like add does, but with less overhead each."""
+        state_ids, symbol_ids, index = self._state_ids, self._symbol_ids, self._index
+        state_id, symbol_id = self._state, partial(self._intern, symbol_ids, self.symbols)
+        file = self._intern(self._file_ids, self._files, location[0])
+        line = location[1]
+        add_from, add_read = self.from_states.append, self.read_symbols.append
+        add_to, add_write = self.to_states.append, self.new_symbols.append
+        add_move, add_file, add_line = (
+            self.directions.append,
+            self._location_files.append,
+            self._location_lines.append,
+        )
+        for from_state, symbol, to_state, new_symbol, direction in rules:
+            if (state := state_ids.get(from_state)) is None:
+                state = state_id(from_state)
+            if (read := symbol_ids.get(symbol)) is None:
+                read = symbol_id(symbol)
+            key = state << 32 | read
+            if key in index:
+                self.add(from_state, symbol, to_state, new_symbol, direction, location)
+                continue
+            if (target := state_ids.get(to_state)) is None:
+                target = state_id(to_state)
+            if (write := symbol_ids.get(new_symbol)) is None:
+                write = symbol_id(new_symbol)
+            index[key] = len(index)
+            add_from(state)
+            add_read(read)
+            add_to(target)
+            add_write(write)
+            add_move(ord(direction))
+            add_file(file)
+            add_line(line)
+
+    def transition(self, row: int) -> Transition:
+        return Transition(
+            self.states[self.from_states[row]],
+            self.symbols[self.read_symbols[row]],
+            self.states[self.to_states[row]],
+            self.symbols[self.new_symbols[row]],
+            chr(self.directions[row]),
+        )
+
+    def location(self, row: int) -> tuple[str, int]:
+        return self._files[self._location_files[row]], self._location_lines[row]
+
+    def sorted_rows(self) -> list[int]:
+        """The rows ordered by state (by name, then suffix), symbol, target state, and so on."""
+        state_keys, symbols = self._state_keys, self.symbols
+        return sorted(
+            range(len(self)),
+            key=lambda row: (
+                state_keys[self.from_states[row]],
+                symbols[self.read_symbols[row]],
+                state_keys[self.to_states[row]],
+                symbols[self.new_symbols[row]],
+                self.directions[row],
+            ),
+        )
+
+
+def _expand_rules(rules: Iterable[tuple]) -> Iterator[tuple[str, str, str, str, str]]:
+    """Expands the rules with sets of states or symbols into a rule per element, and resolves
+    SAME to the state or symbol read."""
+    for from_state, symbol, to_state, new_symbol, dir in rules:
+        for state in from_state if isinstance(from_state, set) else (from_state,):
+            for sym in symbol if isinstance(symbol, set) else (symbol,):
+                yield (
+                    state,
+                    sym,
+                    state if isinstance(to_state, _Same) else to_state,
+                    sym if isinstance(new_symbol, _Same) else new_symbol,
+                    dir,
+                )
+
+
+def _input_alphabet(data: bytes, chunk_size: int = 1 << 20) -> set[str]:
+    """The symbols making up the input tapes of a corpus, leaving out their expected outputs. The
+    corpus is scanned a few lines at a time, so it's never decoded all at once."""
+    alphabet: set[str] = set()
+    start = 0
+    while start < len(data):
+        end = data.find(b"\n", start + chunk_size) + 1 or len(data)
+        alphabet.update(re.sub(rb" => [^\n]*|\{\d+\}", b"", data[start:end]).decode("utf-8"))
+        start = end
+    return alphabet - set(whitespace)
+
+
+def _live_rules(transitions: Sequence[Transition], alphabet: set[str] | None) -> bytearray:
+    """Flags the rules that may fire on some tape made of the alphabet, by growing the set of
+    states reachable from INIT and of symbols that can be under the head (the alphabet, blanks and
+    anything a live rule writes) together until neither changes. Anything flagged off is dead;
+    without an alphabet, every symbol a rule reads is assumed to be on the tape."""
+    by_state: dict[str, list[int]] = {}
+    for i, t in enumerate(transitions):
+        by_state.setdefault(t.from_state, []).append(i)
+    symbols = {t.symbol for t in transitions} if alphabet is None else alphabet | {BLANK}
+    states = {"INIT"}
+    new_states = deque(["INIT"])
+    waiting: dict[str, list[int]] = {}
+    fired = deque()
+    live = bytearray(len(transitions))
+    while new_states or fired:
+        while new_states:
+            for i in by_state.get(new_states.popleft(), ()):
+                if transitions[i].symbol in symbols:
+                    fired.append(i)
+                else:
+                    waiting.setdefault(transitions[i].symbol, []).append(i)
+        if fired:
+            i = fired.popleft()
+            live[i] = 1
+            _, _, to_state, new_symbol, _ = transitions[i]
+            if to_state not in states:
+                states.add(to_state)
+                new_states.append(to_state)
+            if new_symbol not in symbols:
+                symbols.add(new_symbol)
+                fired.extend(waiting.pop(new_symbol, ()))
+    return live
 
 
 class Program:
     def __init__(self) -> None:
-        self._transitions: list[Transition] = []
-        self._locations: dict[Transition, tuple[str, int]] = {}
+        self._store = _TransitionStore()
+        self._families: list[tuple[re.Pattern[str], Callable[[re.Match[str]], object]]] = []
 
     @staticmethod
     def _encode(n: int) -> str:
@@ -166,6 +2261,20 @@ class Program:
             action="store_true",
             help="Compress state names to short identifiers.",
         )
+        argparser.add_argument(
+            "--copy", action="store_true", help="Copy the rules to the clipboard."
+        )
+        argparser.add_argument(
+            "--dot", action="store_true", help="Also write the rules as a Graphviz rules.dot."
+        )
+        argparser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Leave out the dead rules, which can't fire on any tape made of the symbols in the"
+            " input file (any symbol read by a rule, for streamed inputs), from the rules written"
+            " and run. Make sure the input covers every symbol the quest's tapes can have. Without"
+            " it, the dead rules counted are only those that can't fire on any tape at all.",
+        )
         argparser.add_argument(
             "-q",
             "--quiet",
@@ -178,6 +2287,13 @@ class Program:
             action="store_true",
             help="Use multiple processes to run the Turing machine on multiple inputs.",
         )
+        argparser.add_argument(
+            "-w",
+            "--window",
+            type=_positive_int,
+            default=4096,
+            help="With --jobs, how many lines to read ahead and schedule longest-first at a time.",
+        )
         argparser.add_argument(
             "-n",
             "--number",
@@ -188,24 +2304,100 @@ class Program:
         argparser.add_argument(
             "-s", "--skip", type=int, default=None, help="Skip the first N lines from the input."
         )
+        argparser.add_argument(
+            "--stride",
+            type=_positive_int,
+            default=1,
+            help="Only process every Nth line of the input, after the skipped ones.",
+        )
+        argparser.add_argument(
+            "--shard",
+            type=_parse_shard,
+            default=None,
+            help="Only process the I-th of every N selected lines, given as I/N (counting from 0).",
+        )
+        argparser.add_argument(
+            "--sample",
+            type=_sample_size,
+            default=None,
+            help="Only run a sample of this many of the selected lines, stratified by tape length,"
+            " and extrapolate the steps taken on all of them.",
+        )
+        argparser.add_argument(
+            "--seed", type=int, default=0, help="Seed for picking the --sample (default: 0)."
+        )
         argparser.add_argument(
             "-U", "--no-used", action="store_true", help="Do not compute unused rules."
         )
+        argparser.add_argument(
+            "-b",
+            "--backend",
+            choices=sorted(BACKENDS),
+            default=DEFAULT_BACKEND,
+            help=f"Logic Mill implementation to simulate with (default: {DEFAULT_BACKEND}).",
+        )
+        argparser.add_argument(
+            "--max-steps",
+            type=int,
+            default=100_000_000,
+            help="Fail the cases that take more than this many steps, or 0 for no limit"
+            " (default: %(default)s).",
+        )
+        argparser.add_argument(
+            "--timeout",
+            type=float,
+            default=None,
+            help="Fail the cases that run for longer than this many seconds. The Python backends"
+            " stop such runs themselves (and the runs caught looping forever too) and have no"
+            f" timeout by default; for the others, it defaults to {_DEFAULT_TIMEOUT:g}s, cases are"
+            " sent to the workers in chunks that must finish within it and a stuck worker gets"
+            " killed.",
+        )
+        argparser.add_argument(
+            "-C",
+            "--no-cache",
+            action="store_true",
+            help="Simulate every case, ignoring and not updating the per-quest result cache.",
+        )
         argparser.add_argument(
             "-f", "--failing", action="store_true", help="Only show failing cases."
         )
+        argparser.add_argument(
+            "--format",
+            choices=sorted(_REPORTS),
+            default="text",
+            help="How to print the results: colored text, or a record per case and a summary as"
+            " JSON Lines or CSV, streamed as they complete, which implies -q (default: %(default)s).",
+        )
+        argparser.add_argument(
+            "-F",
+            "--fail-fast",
+            action="store_true",
+            help="Stop at the first case that fails or doesn't match its expected output.",
+        )
         args = argparser.parse_args()
+        # Traces would end up in the middle of the records, so the other formats are always quiet.
+        if args.format != "text":
+            args.quiet = True
 
-        transitions = sorted(
-            set(self._transitions),
-            key=lambda t: (
-                base_and_suffix(t.from_state),
-                t.symbol,
-                base_and_suffix(t.to_state),
-                t.new_symbol,
-                t.direction,
-            ),
-        )
+        self._expand_families()
+        store = self._store
+        rows = store.sorted_rows()
+        transitions = [store.transition(row) for row in rows]
+
+        # The alphabet costs a pass over the input, so it's only worth it when pruning; streamed
+        # inputs can't be read ahead of the run for it at all.
+        alphabet = None
+        if args.prune and args.input != "-" and Path(args.input).suffix not in (".gz", ".zst"):
+            data = _map_file(Path(args.input))
+            alphabet = _input_alphabet(data)
+            if isinstance(data, mmap.mmap):
+                data.close()
+        live = _live_rules(transitions, alphabet)
+        dead_rules = len(live) - sum(live)
+        if args.prune:
+            rows = [row for row, is_live in zip(rows, live) if is_live]
+            transitions = [t for t, is_live in zip(transitions, live) if is_live]
 
         frequency = Counter()
         for transition in transitions:
@@ -223,156 +2415,180 @@ class Program:
             state_names[passthru_state] = passthru_state
 
         lines = []
-        for transition in transitions:
+        for row, transition in zip(rows, transitions):
             from_state = state_names[transition.from_state]
             to_state = state_names[transition.to_state]
             symbol = transition.symbol
             new_symbol = transition.new_symbol
             direction = transition.direction
-            comment = ""
-            if loc := self._locations.get(transition):
-                comment = f"  // {loc[0]}:{loc[1]}"
+            file, line = store.location(row)
+            comment = f"  // {file}:{line}"
             lines.append(f"{from_state} {symbol} {to_state} {new_symbol} {direction}{comment}")
 
         rules = "\n".join(lines)
         rules_path = (
             Path("rules.txt") if args.input == "-" else Path(args.input).parent / "rules.txt"
         )
-        dot_path = Path("rules.dot") if args.input == "-" else Path(args.input).parent / "rules.dot"
-        with open(rules_path, "w", encoding="utf-8") as f:
-            f.write(rules)
-        pyperclip.copy(rules)
-        with open(dot_path, "w", encoding="utf-8") as f:
-            f.write("digraph G {\n")
-            f.write('  rankdir="LR";\n')
-            f.write('  node [shape=circle, fontname="monospace"];\n')
-            f.write('  edge [fontname="monospace"];\n')
-            f.write('  "INIT" [shape=doublecircle, style=filled, fillcolor=lightgrey, rank=min];\n')
-            groups = {}
-            for transition in transitions:
-                from_state = transition.from_state
-                to_state = transition.to_state
-                symbol = transition.symbol
-                new_symbol = transition.new_symbol
-                direction = transition.direction
-                groups.setdefault((from_state, to_state), []).append(
-                    (symbol, new_symbol, direction)
-                )
-            for (from_state, to_state), items in groups.items():
-                label = "\\n".join(f"{s}→{ns} {d}" for s, ns, d in items)
-                if all(d == "L" for _, _, d in items):
-                    color = "blue"
-                elif all(d == "R" for _, _, d in items):
-                    color = "red"
-                else:
-                    color = "black"
-                f.write(f'  "{from_state}" -> "{to_state}" [label="{label}", color={color}];\n')
-            f.write('  "HALT" [shape=doublecircle, style=filled, fillcolor=lightgrey, rank=max];\n')
-            f.write("}\n")
-
-        output = []
-
-        unused_rules: set[tuple[str, str]] | None = None
-
-        with suppress(KeyboardInterrupt), ProcessPoolExecutor() as executor:
-            f = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
-            d = f.read()
-            do_run = partial(_do_run, rules=rules, quiet=args.quiet)
-            lines = d.splitlines()
-            if args.skip is not None:
-                lines = lines[args.skip :]
-            if args.number is not None:
-                lines = lines[: args.number]
-            total = len(lines)
-            for line, expected_output, logic_mill, result, steps in (
-                tqdm(
-                    (executor.map if args.jobs else map)(do_run, map(_do_split, lines)),
-                    desc="Processing",
-                    unit="line",
-                    total=total,
-                )
-                if args.quiet
-                else map(do_run, map(_do_split, lines))
-            ):
-                output.append(
-                    (
-                        line,
-                        result,
-                        steps,
-                        logic_mill.state_count(),
-                        expected_output,
-                    )
-                )
-
-                new_unused = set(logic_mill.unused_rules())
-                if unused_rules is None:
-                    unused_rules = new_unused
-                else:
-                    unused_rules &= new_unused
-
-        total_steps = 0
-        state_count = 0
-        had_failing = False
-        for line, result, steps, state_count, expected_output in output:
-            total_steps += steps
-
-            if (
-                args.failing
-                and expected_output is not None
-                and expected_output.strip() == result.strip()
-            ):
-                continue
-            had_failing = True
-
-            print(
-                f"\x1b[1mInput tape\x1b[0m: {line.strip()}{f' ({n})' if (n := count_unary(line.strip())) is not None else ''}"
-            )
-            print(
-                f"\x1b[1mOutput tape\x1b[0m: {result.strip()}{f' ({n})' if (n := count_unary(result.strip())) is not None else ''}"
-            )
-            print(f"\x1b[1mSteps taken\x1b[0m: {steps:_}")
-            expected_output_color = (
-                GREEN
-                if expected_output is not None and expected_output.strip() == result.strip()
-                else RED
-            )
-            print(
-                f"\x1b[1mExpected output\x1b[0m: {expected_output_color}{expected_output.strip() if expected_output is not None else 'N/A'}{f' ({n})' if expected_output is not None and (n := count_unary(expected_output.strip())) is not None else ''}\x1b[0m"
+        _write_if_changed(rules_path, rules)
+        if args.copy:
+            pyperclip.copy(rules)
+        if args.dot:
+            dot_path = (
+                Path("rules.dot") if args.input == "-" else Path(args.input).parent / "rules.dot"
             )
-            print()
-
-        if not had_failing and args.failing:
-            print(f"{GREEN}All {len(output)} cases passed! \x1b[0m")
-            print()
+            _write_if_changed(dot_path, _render_dot(transitions))
 
-        print(f"\x1b[1mRule count\x1b[0m: {len(rules.splitlines())}")
-
-        rule_size_color = GREEN if len(rules) <= 170_000 else RED
-        print(
-            f"\x1b[1mRule size\x1b[0m: {rule_size_color}{len(rules):_} ({len(rules) / 170000:.2%})\x1b[0m"
+        track_coverage = (
+            not args.no_used
+            and args.skip is None
+            and args.number is None
+            and args.stride == 1
+            and args.shard is None
+            and args.sample is None
         )
-        state_count_color = (
-            GREEN if state_count <= 1024 else YELLOW if state_count <= 2**16 else RED
+        max_steps = args.max_steps or None
+        report = _REPORTS[args.format](failing_only=args.failing)
+        report.dead_rules, report.pruned = dead_rules, args.prune
+        jobs = (os.cpu_count() or 1) if args.jobs else 1
+        _init_worker(rules, args.backend)
+        # Backends that can't stop a run midway are timed by the runner, which kills stuck workers;
+        # that takes a pool, even for a single job.
+        deadline = (
+            None
+            if isinstance(_worker_mill, PyLogicMill)
+            else _DEFAULT_TIMEOUT if args.timeout is None else args.timeout
+        )
+        pooled = jobs > 1 or deadline is not None
+        # Verbose traces from the workers are spooled to a file per case, and printed in order.
+        trace_dir = (
+            tempfile.TemporaryDirectory(prefix="traces-") if pooled and not args.quiet else None
+        )
+        options = dict(
+            quiet=args.quiet,
+            track_coverage=track_coverage,
+            max_steps=max_steps,
+            timeout=args.timeout,
+            trace_dir=None if trace_dir is None else trace_dir.name,
+        )
+        # Cached cases wouldn't print their trace, so verbose runs always simulate everything.
+        cache = (
+            _ResultCache(
+                Path(".results.sqlite3")
+                if args.input == "-"
+                else Path(args.input).parent / ".results.sqlite3",
+                rules,
+                track_coverage,
+            )
+            if args.quiet and not args.no_cache
+            else None
         )
-        print(f"\x1b[1mState count\x1b[0m: {state_count_color}{state_count}\x1b[0m")
 
-        print(f"\x1b[1mTotal steps\x1b[0m: {total_steps:_}")
+        # The rules are shipped to each worker exactly once through the pool initializer, instead of
+        # being pickled along with every single input line; the serial path shares the same setup.
+        # Workers read their cases straight from the mapped input file, given their offsets, but
+        # stdin and compressed files can only be streamed.
+        corpus = lines = None
+        if args.input == "-":
+            lines = nullcontext(sys.stdin)
+        elif Path(args.input).suffix in (".gz", ".zst"):
+            lines = _open_compressed(Path(args.input))
+        else:
+            corpus = _Corpus(Path(args.input))
+        with (
+            suppress(KeyboardInterrupt),
+            closing(corpus) if corpus is not None else lines as f,
+            cache or nullcontext(),
+            trace_dir or nullcontext(),
+            _Pool(
+                jobs,
+                initializer=_init_worker,
+                initargs=(rules, args.backend, None if corpus is None else corpus.path),
+            ) as executor,
+        ):
+            cost_model = _CostModel() if cache is None else _CostModel(cache.steps_hint)
+            # Like the cache, repeated tapes would skip their trace, so only dedup quiet runs.
+            recent = _RecentResults(_RECENT_RESULTS) if args.quiet else None
 
-        if output:
-            print(f"\x1b[1mAverage steps\x1b[0m: {total_steps / len(output):_.2f}")
+            def lookup(item: _Case) -> CaseResult | None:
+                if recent is not None and (hit := recent.get(item)) is not None:
+                    return hit
+                return None if cache is None else cache.get(item, max_steps)
 
-        if unused_rules and not args.no_used and args.skip is None and args.number is None:
-            print(f"\n\x1b[1mUnused rules\x1b[0m: {len(unused_rules)}/{len(rules.splitlines())}")
-            dedup = {}
-            for state, symbol in unused_rules:
-                if m := re.match(r"(\w+)_(\d+)$", state):
-                    dedup.setdefault((m.group(1), symbol), set()).add(int(m.group(2)))
+            shard, shards = args.shard or (0, 1)
+            if corpus is not None:
+                numbers = range(len(corpus))[args.skip or 0 :: args.stride][shard::shards]
+                numbers = numbers[: args.number]
+                cases = map(corpus.__getitem__, numbers)
+                total = len(numbers)
+            else:
+                lines = islice(f, args.skip or 0, None, args.stride)
+                lines = islice(lines, shard, None, shards)
+                cases = map(_do_split, (line.rstrip("\r\n") for line in islice(lines, args.number)))
+                total = None
+            if args.sample is not None:
+                # The whole selection has to be read to stratify it, but only streamed inputs have
+                # to be kept around to read the sampled cases again.
+                if corpus is not None:
+                    lengths = [tape_length(case.line.strip()) for case in cases]
                 else:
-                    dedup.setdefault((state, symbol), set()).add(None)
-            for state, rules in sorted(dedup.items()):
-                print(
-                    f"  {state[0]} {state[1]}  " + str(sorted(rules) if None not in rules else "✨")
+                    population = list(cases)
+                    lengths = [tape_length(case.line.strip()) for case in population]
+                report.sample = sample = _Sample(lengths, args.sample, args.seed)
+                cases = (
+                    map(corpus.__getitem__, (numbers[i] for i in sample.indices))
+                    if corpus is not None
+                    else (population[i] for i in sample.indices)
                 )
+                total = len(sample.indices)
+            fn = partial(_do_run_batch if corpus is None else _do_run_spans, **options)
+            pack = list if corpus is None else lambda items: [item.span for item in items]
+            if deadline is not None:
+                scheduled = _imap_deadline(executor, fn, cases, jobs, deadline, lookup, pack)
+            elif jobs > 1:
+                scheduled = _imap_scheduled(
+                    executor,
+                    fn,
+                    cases,
+                    cost=lambda case: cost_model.estimate(case[0].strip()),
+                    jobs=jobs,
+                    window=args.window,
+                    lookup=lookup,
+                    merge_repeats=args.quiet,
+                    pack=pack,
+                )
+            else:
+                scheduled = _imap_serial(
+                    partial(_do_run_batch, **options),
+                    cases,
+                    batch_size=(
+                        _MAX_CHUNK_SIZE
+                        if args.quiet and isinstance(_worker_mill, BatchBackend)
+                        else 1
+                    ),
+                    lookup=lookup,
+                )
+            results = scheduled
+            if args.quiet:
+                results = tqdm(results, desc="Processing", unit="line", total=total)
+            for case in results:
+                if report.sample is not None:
+                    report.sample.record(case.steps, failed=case.error is not None)
+                if case.trace is not None:
+                    _print_trace(case.trace)
+                cost_model.record(case.line.strip(), case.steps)
+                # Only what was simulated just now is new to the cache.
+                if cache is not None and case.error is None and not case.cached:
+                    cache.put(case)
+                if recent is not None:
+                    recent.put(case)
+                report.case(case)
+                if args.fail_fast and report.failures:
+                    report.stopped_early = True
+                    scheduled.close()
+                    executor.terminate()
+                    break
+
+        report.summary(rules, _worker_mill.state_count() if report.cases else 0, track_coverage)
 
     def __call__(
         self,
@@ -385,31 +2601,64 @@ class Program:
         """Writes a rule to the file in the format:
         from_state current_symbol to_state new_symbol direction
         """
-        if isinstance(from_state, set):
-            for state in from_state:
-                self(state, symbol, to_state, new_symbol, dir)
-            return
+        # Sets expand to a rule per element, all sharing the location of this one call.
+        location = get_caller_info()
+        for rule in _expand_rules([(from_state, symbol, to_state, new_symbol, dir)]):
+            self._store.add(*rule, location)
 
-        if isinstance(symbol, set):
-            for sym in symbol:
-                self(
-                    from_state=from_state,
-                    symbol=sym,
-                    to_state=from_state if isinstance(to_state, _Same) else to_state,
-                    new_symbol=sym if isinstance(new_symbol, _Same) else new_symbol,
-                    dir=dir,
-                )
-            return
+    def table(self, *columns: Iterable | str | _Same) -> None:
+        """Writes many rules in one go, given either an iterable of (from_state, symbol, to_state,
+        new_symbol, dir) rows, or those five columns as parallel sequences. A column given as a
+        single string, set or SAME applies to every row, and each row expands like a call does."""
+        location = get_caller_info()
+        if len(columns) == 1:
+            [rows] = columns
+        elif len(columns) == 5:
+            scalar = [isinstance(column, (str, set, _Same)) for column in columns]
+            if all(scalar):
+                raise TypeError("table() needs at least one column to be a sequence")
+            length = len(next(column for column, s in zip(columns, scalar) if not s))
+            rows = zip(
+                *(repeat(column, length) if s else column for column, s in zip(columns, scalar)),
+                strict=True,
+            )
+        else:
+            raise TypeError(f"table() takes 1 or 5 arguments, but {len(columns)} were given")
 
-        transition = Transition(
-            from_state=from_state,
-            symbol=symbol,
-            to_state=from_state if isinstance(to_state, _Same) else to_state,
-            new_symbol=symbol if isinstance(new_symbol, _Same) else new_symbol,
-            direction=dir,
-        )
-        self._transitions.append(transition)
-        self._locations[transition] = get_caller_info()
+        self._store.extend(_expand_rules(rows), location)
+
+    def family(self, pattern: str, callback: Callable[[re.Match[str]], object]) -> None:
+        """Registers the callback writing the rules of the states whose whole name matches the
+        pattern, given the match. It's only called once the program is done, for each state that
+        can be reached from INIT, so a family of states like M_{n}_{m} needn't be written out in
+        full; the callback just stops writing rules past the largest state it supports."""
+        self._families.append((re.compile(pattern), callback))
+
+    def _expand_families(self) -> None:
+        """Calls the family callbacks for the states reached, breadth-first from INIT."""
+        if not self._families:
+            return
+        store = self._store
+        successors: dict[str, list[str]] = {}
+        scanned = 0
+        seen = {"INIT"}
+        queue = deque(["INIT"])
+        while queue:
+            state = queue.popleft()
+            for pattern, callback in self._families:
+                if match := pattern.fullmatch(state):
+                    callback(match)
+                    break
+            # Only the rules added since the last state was expanded are new edges.
+            for row in range(scanned, len(store)):
+                successors.setdefault(store.states[store.from_states[row]], []).append(
+                    store.states[store.to_states[row]]
+                )
+            scanned = len(store)
+            for target in successors.get(state, ()):
+                if target not in seen:
+                    seen.add(target)
+                    queue.append(target)
 
     def ignore(self, state: str | set[str], symbol: str | set[str], dir: Literal["L", "R"]) -> None:
         """Writes a rule that ignores the current symbol and stays in the same state."""